@@ -1,378 +1,1095 @@
 import argparse
+import contextlib
+import functools
+import hashlib
+import itertools
 import json
-import math
+import queue
+import re
 import sqlite3
-from datetime import datetime
-from typing import Any, Dict, List, Optional, Tuple
-
-from flask import Flask, current_app, jsonify, request
+import threading
+from typing import Any, BinaryIO, Dict, Iterator, List, Optional, Tuple
+
+from flask import (
+    Flask,
+    Response,
+    current_app,
+    jsonify,
+    request,
+    stream_with_context,
+)
 from flask_cors import CORS
 
-# Common airport coordinates
-# Format: (latitude, longitude)
-AIRPORT_COORDINATES = {
-    "JFK": (40.6413, -73.7781),  # New York JFK
-    "LHR": (51.4700, -0.4543),  # London Heathrow
-    "SFO": (37.6213, -122.3790),  # San Francisco
-    "LAX": (33.9416, -118.4085),  # Los Angeles
-    "ORD": (41.9742, -87.9073),  # Chicago O'Hare
-    "DFW": (32.8998, -97.0403),  # Dallas/Fort Worth
-    "ATL": (33.6407, -84.4277),  # Atlanta
-    "MIA": (25.7959, -80.2870),  # Miami
-    "SEA": (47.4502, -122.3088),  # Seattle
-    "BOS": (42.3656, -71.0096),  # Boston
-    "IAD": (38.9445, -77.4558),  # Washington Dulles
-    "DEN": (39.8561, -104.6737),  # Denver
-    "LAS": (36.0840, -115.1537),  # Las Vegas
-    "PHX": (33.4374, -112.0078),  # Phoenix
-    "EWR": (40.6895, -74.1745),  # Newark
-    "IAH": (29.9902, -95.3368),  # Houston
-    "MCO": (28.4294, -81.3089),  # Orlando
-    "YYZ": (43.6777, -79.6248),  # Toronto
-    "CDG": (49.0097, 2.5479),  # Paris Charles de Gaulle
-    "AMS": (52.3105, 4.7683),  # Amsterdam
-    "FRA": (50.0379, 8.5622),  # Frankfurt
-    "DXB": (25.2532, 55.3657),  # Dubai
-    "SIN": (1.3644, 103.9915),  # Singapore
-    "HKG": (22.3080, 113.9185),  # Hong Kong
-    "NRT": (35.7720, 140.3929),  # Tokyo Narita
-    "PEK": (40.0799, 116.6031),  # Beijing
-    "SYD": (-33.9461, 151.1772),  # Sydney
-    "FCO": (41.8003, 12.2389),
-    # Add more airports as needed
+from archive import archive_raw_data, load_raw_data, setup_archive
+from broadcast import commit_broadcaster
+from channel import Channel
+from compression import UnsupportedEncoding, decompressing_reader, supported_encodings
+from db import FLIGHT_DB_PATH, QUERY_DB_PATH, chunked_lookup, close_all, get_database
+from ingest import (
+    DEFAULT_BATCH_SIZE,
+    DEFAULT_WINDOW,
+    IngestQueue,
+    PayloadDeduplicator,
+    dedup_payload,
+)
+from parsers import epoch_ms, get_parser
+from positions import (
+    LATITUDE_SQL,
+    LONGITUDE_SQL,
+    earliest_change,
+    position_tracker,
+    readings_cursor,
+    setup_positions,
+)
+from schema import CRUISE_INDEX, setup_indexes, setup_readings, setup_timestamps
+from serialization import dumps, json_array_chunks
+from series import SERIES_METRICS, SeriesCache, downsample
+from track import TrackSimplifier, tolerance_for_zoom
+
+try:
+    from flask_sock import Sock
+except ImportError:
+    Sock = None
+
+# Types of value the sqlite3 module can store in a column
+STORABLE_TYPES = (type(None), int, float, str, bytes)
+# Range of integers SQLite can store
+SQLITE_INT_MIN = -(2**63)
+SQLITE_INT_MAX = 2**63 - 1
+
+# Number of lines of a streamed upload committed per transaction
+STREAM_BATCH_SIZE = 1000
+# Maximum number of per-line errors reported for a streamed upload
+MAX_STREAM_ERRORS = 100
+
+# Rows read from the database at a time while streaming a response
+RESPONSE_FETCH_SIZE = 1000
+
+# Pages allowed to call the API from a browser (regular expressions)
+ALLOWED_ORIGINS = [
+    r"http://localhost:[0-9]+",
+    r"http://127.0.0.1:[0-9]+",
+]
+
+# Number of SQLite virtual machine instructions between checks for whether a
+# query run over the WebSocket channel was cancelled
+QUERY_PROGRESS_INTERVAL = 10000
+
+# Fields of the readings served to the frontend, and the SQL that reads each
+# one from readings r LEFT JOIN positions p (None if it isn't read from the
+# database). Positions are the ones dead-reckoned at ingest.
+READING_COLUMNS = {
+    "id": "r.id",
+    "airline": None,  # The airline the server was started for
+    "timestamp": "r.timestamp_ms",  # Epoch milliseconds
+    "departure_airport": "r.departure_airport",
+    "destination_airport": "r.destination_airport",
+    "flight_number": "r.flight_number",
+    "aircraft_type": "r.aircraft_type",
+    "latitude": LATITUDE_SQL,
+    "longitude": LONGITUDE_SQL,
+    "altitude": "r.altitude",
+    "estimated_arrival_time": "r.estimated_arrival_time",
+    "scheduled_departure_time": "r.scheduled_departure_time",
+    "time_to_destination_minutes": "r.time_to_destination_minutes",
+    "total_flight_time_minutes": "r.total_flight_time_minutes",
+    "distance_to_destination": "r.distance_to_destination",
+    "distance_from_origin": "r.distance_from_origin",
+    "distance_traveled": "r.distance_traveled",
+    "wind_speed": "r.wind_speed",
+    "wind_direction": "r.wind_direction",
+    "ground_speed": "r.ground_speed",
+    "outside_air_temperature": "r.outside_air_temperature",
+    "true_heading": "r.true_heading",
+    "weight_on_wheels": "r.weight_on_wheels",
+    "decompression": "r.decompression",
+    "all_doors_closed": "r.all_doors_closed",
+    "position_interpolated": "COALESCE(p.position_interpolated, 0)",
+    "position_source": "COALESCE(p.position_source, 'actual')",
 }
+READING_FIELDS = tuple(READING_COLUMNS)
+# Fields that need the positions table
+POSITION_FIELDS = ("latitude", "longitude", "position_interpolated", "position_source")
+
+# Sent by /readings when there are no cruise readings at all
+NO_POSITION_DATA = {"status": "error", "message": "No position data available"}
+
+# Response formats for /readings: a list of reading objects, or one array
+# per field (see to_columnar)
+READINGS_FORMATS = ("rows", "columnar")
+
+# Fields describing the flight rather than the moment, which are the same in
+# almost every reading, so the columnar format sends them only once
+FLIGHT_CONSTANT_FIELDS = (
+    "airline",
+    "departure_airport",
+    "destination_airport",
+    "flight_number",
+    "aircraft_type",
+    "scheduled_departure_time",
+    "total_flight_time_minutes",
+)
+
+# Points returned by /readings/series when max_points isn't given, and the
+# most that can be asked for
+DEFAULT_SERIES_POINTS = 500
+MAX_SERIES_POINTS = 5000
+
+# Width in pixels of the whole world at zoom 1 if /readings/track isn't told
+DEFAULT_MAP_WIDTH = 1024
+
+# Seconds between keepalive comments on an idle /readings/stream, so proxies
+# don't time it out and disconnected clients are noticed
+SSE_KEEPALIVE_INTERVAL = 15
+
+
+def parse_for_airline(
+    content: Dict[str, Any], airline: Optional[str] = None
+) -> Dict[str, Any]:
+    """
+    Parse the incoming record content and format it for database insertion.
+
+    Args:
+        content: Dictionary containing the flight data
+        airline: Airline whose registered parser to use (see parsers.py),
+                 or None for the default parser
 
+    Returns:
+        Dictionary with formatted data ready for database insertion
+    """
+    return get_parser(airline)(content)
+
+
+@functools.lru_cache(maxsize=64)
+def _insert_sql(fields: Tuple[str, ...]) -> str:
+    """
+    Build the INSERT statement for a reading with the given fields.
 
-def get_airport_coordinates(airport_code: str) -> Optional[Tuple[float, float]]:
+    Cached per field tuple, so every reading with the same fields gets the
+    identical SQL string and hits the connection's prepared statement cache.
     """
-    Get the coordinates for a given airport code.
+    placeholders = ",".join(["?" for _ in fields])
+    return f"INSERT INTO readings ({','.join(fields)}) VALUES ({placeholders})"
+
+
+def check_storable(parsed_data: Dict[str, Any]) -> None:
+    """
+    Check that parsed data can be stored in the readings table, with a
+    timestamp that can be read as a time and values SQLite can store, so a
+    reading that can't be is rejected on its own rather than failing the
+    transaction it's written in.
+
+    Raises:
+        ValueError: If the timestamp can't be read or a value can't be stored
+    """
+    epoch_ms(parsed_data["timestamp"])
+    for field, value in parsed_data.items():
+        if not isinstance(value, STORABLE_TYPES) or (
+            isinstance(value, int) and not SQLITE_INT_MIN <= value <= SQLITE_INT_MAX
+        ):
+            raise ValueError(f"{field} can't be stored: {value!r}")
+
+
+def write_to_readings(parsed_data: Dict[str, Any]) -> None:
+    """
+    Write the parsed data to the readings table.
 
     Args:
-        airport_code: IATA airport code (e.g., 'JFK', 'SFO')
+        parsed_data: Dictionary containing formatted flight data
 
-    Returns:
-        Tuple of (latitude, longitude) if found, None if not found
+    Raises:
+        ValueError: If the timestamp can't be read as a time
     """
-    return AIRPORT_COORDINATES.get(airport_code.upper())
+    # The raw payload goes to the compressed archive rather than the row
+    row = dict(parsed_data)
+    raw_data = row.pop("raw_data", None)
+    row["timestamp_ms"] = epoch_ms(row["timestamp"])
+
+    database = get_database(FLIGHT_DB_PATH)
+    with database.writer() as conn:
+        # Look up the SQL insert statement for the fields in the parsed data
+        sql = _insert_sql(tuple(row))
+
+        # Execute the insert with the values from parsed_data, in field order
+        cursor = conn.execute(sql, tuple(row.values()))
+
+        if raw_data is not None:
+            archive_raw_data(conn, [(cursor.lastrowid, raw_data)])
+
+        # Dead-reckon its position, and any positions after it that changed
+        position_tracker(database).update(conn)
 
 
-def calculate_new_position(
-    start_lat: float,
-    start_lon: float,
-    heading: float,
-    speed: float,  # ground speed in knots
-    elapsed_time: float,  # time in hours
-) -> Tuple[float, float]:
+def write_batch_to_readings(batch: List[Dict[str, Any]]) -> List[str]:
     """
-    Calculate new position based on initial position, heading, speed and time elapsed.
-    Uses great circle navigation formulas for accuracy over longer distances.
+    Write many parsed readings to the readings table in a single transaction.
+
+    Readings at a time already in the table, or earlier in the same batch,
+    are skipped rather than failing the whole batch on the unique index on
+    timestamp_ms. A reading whose timestamp can't be read, or that SQLite
+    can't store, is left out on its own, and the rest of the batch is still
+    recorded.
 
     Args:
-        start_lat: Starting latitude in degrees
-        start_lon: Starting longitude in degrees
-        heading: True heading in degrees
-        speed: Ground speed in knots
-        elapsed_time: Time elapsed in hours
+        batch: List of dictionaries containing formatted flight data
 
     Returns:
-        Tuple of (new_latitude, new_longitude) in degrees
+        Status for each reading in the batch: "recorded", "duplicate" or
+        "error"
     """
-    # Convert inputs to radians
-    lat1 = math.radians(start_lat)
-    lon1 = math.radians(start_lon)
-    heading_rad = math.radians(heading)
+    statuses = ["recorded"] * len(batch)
 
-    # Calculate distance traveled in nautical miles
-    distance = speed * elapsed_time
+    timestamps: List[Optional[int]] = []
+    for i, parsed_data in enumerate(batch):
+        try:
+            timestamps.append(epoch_ms(parsed_data["timestamp"]))
+        except ValueError as e:
+            print(e)
+            statuses[i] = "error"
+            timestamps.append(None)
+
+    database = get_database(FLIGHT_DB_PATH)
+    with database.writer() as conn:
+        # Find the times that are already stored
+        rows = chunked_lookup(
+            conn,
+            "SELECT timestamp_ms FROM readings WHERE timestamp_ms IN ({placeholders})",
+            [timestamp for timestamp in timestamps if timestamp is not None],
+        )
+        existing = {row[0] for row in rows}
+
+        # Group the new readings by field list so each group is one
+        # executemany. Raw payloads go to the compressed archive instead.
+        groups: Dict[Tuple[str, ...], List[Tuple[Any, ...]]] = {}
+        group_raw_data: Dict[Tuple[str, ...], List[Optional[str]]] = {}
+        group_indexes: Dict[Tuple[str, ...], List[int]] = {}
+        for i, (parsed_data, timestamp) in enumerate(zip(batch, timestamps)):
+            if timestamp is None:
+                continue
+            if timestamp in existing:
+                statuses[i] = "duplicate"
+                continue
+            existing.add(timestamp)
+
+            row = dict(parsed_data)
+            raw_data = row.pop("raw_data", None)
+            row["timestamp_ms"] = timestamp
+            fields = tuple(row)
+            groups.setdefault(fields, []).append(tuple(row.values()))
+            group_raw_data.setdefault(fields, []).append(raw_data)
+            group_indexes.setdefault(fields, []).append(i)
+
+        # Savepoints only nest inside a transaction; on their own they'd
+        # commit each group separately
+        if not conn.in_transaction:
+            conn.execute("BEGIN")
+
+        archived = []
+        for fields, rows in groups.items():
+            sql = _insert_sql(fields)
+            conn.execute("SAVEPOINT batch_group")
+            try:
+                conn.executemany(sql, rows)
+            except (sqlite3.Error, OverflowError):
+                # Something in the group can't be stored. Undo the rows
+                # inserted before it, and insert them one at a time to find
+                # which.
+                conn.execute("ROLLBACK TO batch_group")
+                ids = []
+                for i, row in zip(group_indexes[fields], rows):
+                    try:
+                        ids.append(conn.execute(sql, row).lastrowid)
+                    except (sqlite3.Error, OverflowError) as e:
+                        print(e)
+                        statuses[i] = "error"
+                        ids.append(None)
+            else:
+                # The writer lock means nothing else inserts in between, so
+                # the rows just inserted have consecutive ids ending at the
+                # last one
+                (last_id,) = conn.execute("SELECT last_insert_rowid()").fetchone()
+                ids = range(last_id - len(rows) + 1, last_id + 1)
+            conn.execute("RELEASE batch_group")
+
+            archived.extend(
+                (reading_id, raw_data)
+                for reading_id, raw_data in zip(ids, group_raw_data[fields])
+                if reading_id is not None and raw_data is not None
+            )
 
-    # Convert distance to angular distance in radians
-    # 60 nautical miles = 1 degree of great circle arc
-    angular_distance = math.radians(distance / 60.0)
+        archive_raw_data(conn, sorted(archived))
 
-    # Calculate new position using great circle navigation formulas
-    lat2 = math.asin(
-        math.sin(lat1) * math.cos(angular_distance)
-        + math.cos(lat1) * math.sin(angular_distance) * math.cos(heading_rad)
-    )
+        # Dead-reckon their positions, and any positions after them that changed
+        position_tracker(database).update(conn)
 
-    lon2 = lon1 + math.atan2(
-        math.sin(heading_rad) * math.sin(angular_distance) * math.cos(lat1),
-        math.cos(angular_distance) - math.sin(lat1) * math.sin(lat2),
-    )
+    return statuses
 
-    # Convert back to degrees
-    return (math.degrees(lat2), math.degrees(lon2))
 
+def request_body() -> BinaryIO:
+    """
+    Get the request body as a stream, decompressing it on the fly if it was
+    sent with a gzip, deflate or zstd Content-Encoding.
+
+    Raises:
+        UnsupportedEncoding: If the body uses an encoding we can't decode
+    """
+    return decompressing_reader(request.stream, request.headers.get("Content-Encoding"))
 
-def interpolate_missing_positions(
-    readings: List[Dict], departure_airport: str = None
-) -> List[Dict]:
+
+def unsupported_encoding(e: UnsupportedEncoding) -> Tuple[Response, int]:
+    """
+    Build the 415 response for a body we can't decode, which lists the
+    encodings we can in its Accept-Encoding header (RFC 7694).
     """
-    Fill in missing latitude/longitude values in flight readings using
-    dead reckoning based on heading, speed, and time elapsed.
+    encodings = supported_encodings()
+    response = jsonify({"error": str(e), "supported_encodings": encodings})
+    response.headers["Accept-Encoding"] = ", ".join(encodings)
+    return response, 415
+
+
+@functools.lru_cache(maxsize=64)
+def readings_query(fields: Tuple[str, ...], include_raw: bool) -> str:
+    """
+    Build the SELECT for readings with the given fields, for to_readings.
+
+    Only the columns those fields need are read, and positions are only
+    joined if a position field is asked for.
 
     Args:
-        readings: List of reading dictionaries with timestamp, heading, ground_speed,
-                 latitude, and longitude fields
-        departure_airport: Optional IATA code for departure airport to use as starting position
+        fields: Fields to read, from READING_COLUMNS
+        include_raw: Whether to also read what's needed for raw payloads
 
     Returns:
-        List of readings with missing positions filled in where possible
+        SELECT ... FROM clause, to add WHERE and ORDER BY to. The WHERE
+        clause must include r.altitude > 10000, since the query is pinned to
+        the cruise index.
     """
-    if not readings:
-        return readings
+    columns = [
+        f"{READING_COLUMNS[field]} AS {field}"
+        for field in fields
+        if READING_COLUMNS[field] is not None
+    ]
+    if include_raw:
+        columns += ["r.id AS reading_id", "r.raw_data AS raw_data"]
+    # On a short flight the unique index on timestamp_ms looks as cheap to
+    # the planner, but isn't covering and reads every row from the table
+    query = f"SELECT {', '.join(columns)} FROM readings r INDEXED BY {CRUISE_INDEX}"
+    if any(field in POSITION_FIELDS for field in fields):
+        query += " LEFT JOIN positions p ON p.reading_id = r.id"
+    return query
+
+
+def window_condition(
+    start: Optional[int] = None,
+    end: Optional[int] = None,
+    after: Optional[int] = None,
+) -> Tuple[str, Tuple[int, ...]]:
+    """
+    Build the WHERE condition for cruise readings in a time window.
 
-    # Sort readings by timestamp
-    sorted_readings = sorted(readings, key=lambda x: x["timestamp"])
-
-    # Find last known good position to start from
-    last_good_idx = -1
-    for i, reading in enumerate(sorted_readings):
-        if reading["latitude"] is not None and reading["longitude"] is not None:
-            last_good_idx = i
-            break
-
-    # If no good starting position found, try to use departure airport coordinates
-    if last_good_idx == -1 and departure_airport:
-        airport_coords = get_airport_coordinates(departure_airport)
-        if airport_coords:
-            # Set the first reading's position to the departure airport
-            sorted_readings[0]["latitude"] = airport_coords[0]
-            sorted_readings[0]["longitude"] = airport_coords[1]
-            sorted_readings[0]["position_interpolated"] = True
-            sorted_readings[0]["position_source"] = "airport_reference"
-            last_good_idx = 0
-
-    # If still no good starting position, we can't interpolate
-    if last_good_idx == -1:
-        return readings
+    Each bound is a comparison on the time, so SQLite answers it with a
+    range scan of the cruise index rather than reading the whole flight.
 
-    # Process all readings after the first good position
-    for i in range(last_good_idx + 1, len(sorted_readings)):
-        current = sorted_readings[i]
-        previous = sorted_readings[i - 1]
-
-        # Skip if we already have position
-        if current["latitude"] is not None and current["longitude"] is not None:
-            current["position_interpolated"] = False
-            current["position_source"] = "actual"
-            continue
-
-        # Skip if we don't have required navigation data
-        if (
-            current["ground_speed"] is None
-            or current["true_heading"] is None
-            or previous["latitude"] is None
-            or previous["longitude"] is None
-        ):
-            continue
+    Args:
+        start: Earliest time to include, in epoch milliseconds
+        end: Latest time to include, in epoch milliseconds
+        after: Time the previous page ended with, to start after
 
-        # Calculate time elapsed in hours
-        try:
-            current_time = datetime.fromisoformat(current["timestamp"])
-            prev_time = datetime.fromisoformat(previous["timestamp"])
-            elapsed_time = (current_time - prev_time).total_seconds() / 3600.0
-        except (ValueError, TypeError):
-            continue
+    Returns:
+        The condition, and its parameters
+    """
+    # Readings whose timestamp couldn't be read have no place in time
+    conditions = ["r.altitude > 10000", "r.timestamp_ms IS NOT NULL"]
+    params = []
+    for condition, value in [
+        ("r.timestamp_ms >= ?", start),
+        ("r.timestamp_ms <= ?", end),
+        ("r.timestamp_ms > ?", after),
+    ]:
+        if value is not None:
+            conditions.append(condition)
+            params.append(value)
+    return " AND ".join(conditions), tuple(params)
+
+
+def parse_fields(value: Optional[str]) -> Tuple[Tuple[str, ...], bool]:
+    """
+    Parse a comma-separated list of reading fields from a request.
 
-        # Calculate new position
-        try:
-            new_lat, new_lon = calculate_new_position(
-                previous["latitude"],
-                previous["longitude"],
-                current["true_heading"],
-                current["ground_speed"],
-                elapsed_time,
-            )
+    The timestamp is always included, since readings are ordered and merged
+    by it. "raw_data" asks for each reading's raw payload.
 
-            # Update the reading with calculated position
-            current["latitude"] = round(new_lat, 4)
-            current["longitude"] = round(new_lon, 4)
-            current["position_interpolated"] = True
-            current["position_source"] = "interpolated"
+    Args:
+        value: The list, or None for every field
 
-        except (ValueError, TypeError):
-            continue
+    Returns:
+        The fields, and whether raw_data was asked for
 
-    return sorted_readings
+    Raises:
+        ValueError: If a field doesn't exist
+    """
+    if value is None:
+        return READING_FIELDS, False
 
+    requested = [field.strip() for field in value.split(",") if field.strip()]
+    unknown = [
+        field
+        for field in requested
+        if field not in READING_COLUMNS and field != "raw_data"
+    ]
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(unknown)}")
 
-def parse_for_airline(content: Dict[str, Any]) -> Dict[str, Any]:
+    fields = ["timestamp"]
+    for field in requested:
+        if field not in fields and field != "raw_data":
+            fields.append(field)
+    return tuple(fields), "raw_data" in requested
+
+
+def read_json_body() -> Any:
+    """Read the request body as JSON, decompressing it first if needed."""
+    if not request.headers.get("Content-Encoding"):
+        return request.get_json()
+    return json.load(request_body())
+
+
+def read_batch_contents() -> List[Any]:
     """
-    Parse the incoming record content and format it for database insertion.
+    Read the list of record contents from a batch request body.
+
+    Accepts a JSON array of contents, a JSON object with a "contents" array,
+    or an NDJSON body with one content object per line.
+    """
+    if request.mimetype in ("application/x-ndjson", "application/ndjson"):
+        return [json.loads(line) for line in request_body() if line.strip()]
+
+    data = read_json_body()
+    if isinstance(data, dict):
+        data = data.get("contents")
+    if not isinstance(data, list):
+        raise ValueError("Expected a list of contents")
+    return data
+
+
+def run_query(
+    query: str, cancelled: Optional[threading.Event] = None
+) -> List[Dict[str, Any]]:
+    """
+    Run an ad-hoc query against the query database.
 
     Args:
-        content: Dictionary containing the flight data
+        query: SQL to run
+        cancelled: Optional event that aborts the query once set, checked
+                   every QUERY_PROGRESS_INTERVAL SQLite instructions
 
-    Returns:
-        Dictionary with formatted data ready for database insertion
+    Raises:
+        sqlite3.OperationalError: If the query was cancelled ("interrupted")
     """
-    # Extract raw_data if it exists, ensure it's a string
-    raw_data = content.get("raw_data")
-    if isinstance(raw_data, dict):
-        raw_data = json.dumps(raw_data)
-    elif raw_data is None:
-        raw_data = "{}"
+    with get_database(QUERY_DB_PATH).reader() as conn:
+        if cancelled is None:
+            return [dict(row) for row in conn.execute(query).fetchall()]
 
-    # Format the data for database insertion
-    return {
-        "timestamp": content.get("timestamp"),
-        "departure_airport": content.get("departure_airport"),
-        "destination_airport": content.get("destination_airport"),
-        "flight_number": content.get("flight_number"),
-        "aircraft_type": content.get("aircraft_type"),
-        "latitude": content.get("latitude"),
-        "longitude": content.get("longitude"),
-        "altitude": content.get("altitude"),
-        "estimated_arrival_time": content.get("estimated_arrival_time"),
-        "scheduled_departure_time": content.get("scheduled_departure_time"),
-        "time_to_destination_minutes": content.get("time_to_destination_minutes"),
-        "total_flight_time_minutes": content.get("total_flight_time_minutes"),
-        "distance_to_destination": content.get("distance_to_destination"),
-        "distance_from_origin": content.get("distance_from_origin"),
-        "distance_traveled": content.get("distance_traveled"),
-        "wind_speed": content.get("wind_speed"),
-        "wind_direction": content.get("wind_direction"),
-        "ground_speed": content.get("ground_speed"),
-        "outside_air_temperature": content.get("outside_air_temperature"),
-        "true_heading": content.get("true_heading"),
-        "weight_on_wheels": content.get("weight_on_wheels", False),
-        "decompression": content.get("decompression", False),
-        "all_doors_closed": content.get("all_doors_closed", True),
-        "raw_data": raw_data,
-    }
+        conn.set_progress_handler(cancelled.is_set, QUERY_PROGRESS_INTERVAL)
+        try:
+            return [dict(row) for row in conn.execute(query).fetchall()]
+        finally:
+            conn.set_progress_handler(None, 0)
 
 
-def write_to_readings(parsed_data: Dict[str, Any]) -> None:
+def query_rows(query: str) -> Iterator[Dict[str, Any]]:
     """
-    Write the parsed data to the readings table.
+    Run an ad-hoc query against the query database, yielding rows as they
+    are read rather than all at once.
+    """
+    with get_database(QUERY_DB_PATH).reader() as conn:
+        cursor = conn.execute(query)
+        # Finish the statement even if the client goes away part way through,
+        # before the connection goes back to the pool
+        with contextlib.closing(cursor):
+            while True:
+                rows = cursor.fetchmany(RESPONSE_FETCH_SIZE)
+                if not rows:
+                    return
+                for row in rows:
+                    yield dict(row)
+
+
+def json_response(data: Any, status: int = 200) -> Response:
+    """Like jsonify, but serialized with serialization.dumps."""
+    return current_app.response_class(
+        dumps(data), status=status, mimetype="application/json"
+    )
 
-    Args:
-        parsed_data: Dictionary containing formatted flight data
+
+def streamed_json_response(chunks: Iterator[bytes]) -> Response:
     """
-    conn = sqlite3.connect("flight_data.db")
-    try:
-        cursor = conn.cursor()
+    Send JSON chunks as a chunked response, as they are generated.
 
-        # Create the SQL insert statement dynamically based on the parsed data
-        fields = list(parsed_data.keys())
-        placeholders = ",".join(["?" for _ in fields])
-        sql = f"INSERT INTO readings ({','.join(fields)}) VALUES ({placeholders})"
+    The first chunk is generated straight away, so that errors before any
+    JSON is produced (like a query that doesn't compile) are raised here,
+    while there's still a chance to send an error status instead.
+    """
+    first = next(chunks)
+    return current_app.response_class(
+        stream_with_context(itertools.chain([first], chunks)),
+        mimetype="application/json",
+    )
 
-        # Execute the insert with the values from parsed_data
-        cursor.execute(sql, list(parsed_data.values()))
-        conn.commit()
-    finally:
-        conn.close()
+
+def readings_version(conn: sqlite3.Connection) -> str:
+    """
+    Get a token that changes whenever readings are added or removed, or
+    their positions are backfilled.
+
+    This is the readings cursor and the row count, both of which SQLite
+    answers from b-trees without reading any row data. PRAGMA data_version
+    can't be used because it only tracks commits by other connections, and
+    readers come from a pool.
+    """
+    (count,) = conn.execute("SELECT COUNT(*) FROM readings").fetchone()
+    return f"{readings_cursor(conn)}-{count}"
 
 
-def create_app(airline=None):
+def etag_for(version: str) -> str:
+    """Build the ETag for a response from the data version and the request."""
+    digest = hashlib.blake2b(digest_size=8)
+    digest.update(request.full_path.encode("utf-8"))
+    digest.update(str(current_app.config["AIRLINE"]).encode("utf-8"))
+    return f"{version}-{digest.hexdigest()}"
+
+
+def not_modified(etag: str) -> Optional[Response]:
+    """Get a 304 response if the client already has this version."""
+    if not request.if_none_match.contains(etag):
+        return None
+    response = current_app.response_class(status=304)
+    return with_etag(response, etag)
+
+
+def with_etag(response: Response, etag: str) -> Response:
+    """Tag a response, and have clients revalidate it before every reuse."""
+    response.set_etag(etag)
+    response.headers["Cache-Control"] = "no-cache"
+    return response
+
+
+def to_columnar(readings: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Convert readings to the columnar format, which has one array per field
+    instead of one object per reading, so keys aren't repeated in every
+    reading and flight constants are only sent once.
+
+    Args:
+        readings: Readings in the format served to the frontend
+
+    Returns:
+        Dictionary with the number of readings, "constants" mapping each
+        flight constant field that has the same value in every reading to
+        that value, and "columns" mapping every other field to its values in
+        reading order
+    """
+    constants = {}
+    columns = {}
+    if readings:
+        for field in readings[0]:
+            values = [reading[field] for reading in readings]
+            if field in FLIGHT_CONSTANT_FIELDS and values.count(values[0]) == len(
+                values
+            ):
+                constants[field] = values[0]
+            else:
+                columns[field] = values
+    return {
+        "format": "columnar",
+        "count": len(readings),
+        "constants": constants,
+        "columns": columns,
+    }
+
+
+def create_app(
+    airline=None,
+    ingest_mode="sync",
+    ingest_batch_size=DEFAULT_BATCH_SIZE,
+    ingest_window=DEFAULT_WINDOW,
+):
     """Factory function to create the Flask application with configuration."""
     app = Flask(__name__)
 
     app.config["AIRLINE"] = airline
+    app.config["INGEST_MODE"] = ingest_mode
+
+    database = get_database(FLIGHT_DB_PATH)
+    with database.writer() as conn:
+        setup_readings(conn)
+        setup_archive(conn)
+        setup_positions(conn)
+        setup_timestamps(conn)
+        setup_indexes(conn)
+        # Catch up on readings written while the server wasn't running
+        position_tracker(database).update(conn)
+
+    # In async mode /record only enqueues readings, and a background thread
+    # commits them in groups
+    ingest_queue = None
+    if ingest_mode == "async":
+        ingest_queue = IngestQueue(
+            write_batch_to_readings,
+            batch_size=ingest_batch_size,
+            window=ingest_window,
+        )
+        ingest_queue.start()
+    app.extensions["ingest_queue"] = ingest_queue
+
+    # Wakes /readings/stream subscribers after each commit, whichever of the
+    # sync or async write paths made it
+    broadcaster = commit_broadcaster(get_database(FLIGHT_DB_PATH))
+    app.extensions["broadcaster"] = broadcaster
+
+    # Remembers recently recorded payloads so exact repeats can be skipped
+    deduplicator = PayloadDeduplicator()
+
+    # Downsampled /readings/series, rebuilt once readings change
+    series_cache = SeriesCache()
+
+    # The flight track for /readings/track, kept ready to simplify at any zoom
+    track = TrackSimplifier()
+
+    def recorder_source():
+        """Identify the recorder that sent the current request."""
+        return request.headers.get("X-Recorder-Source") or request.remote_addr or ""
 
     cors = CORS(
         app,
         resources={
             r"/*": {
-                "origins": [
-                    r"http://localhost:[0-9]+",
-                    r"http://127.0.0.1:[0-9]+",
-                ],
+                "origins": ALLOWED_ORIGINS,
                 "methods": ["GET", "POST"],
-                "allow_headers": ["Content-Type"],
+                "allow_headers": [
+                    "Content-Type",
+                    "Content-Encoding",
+                    "X-Recorder-Source",
+                ],
+                "expose_headers": ["X-Next-Cursor"],
             }
         },
     )
 
-    def get_all_readings():
-        """Get all position data for the flight."""
-        conn = sqlite3.connect("flight_data.db")
-        conn.row_factory = sqlite3.Row
-        cursor = conn.cursor()
+    def to_readings(conn, results, fields, include_raw):
+        """
+        Convert readings rows selected with readings_query to the reading
+        format served to the frontend.
+
+        Raw payloads are only decoded from the archive if include_raw is set.
+        """
+        airline = current_app.config["AIRLINE"]
+        readings = [
+            {
+                field: airline if field == "airline" else result[field]
+                for field in fields
+            }
+            for result in results
+        ]
+        if "position_interpolated" in fields:
+            for reading in readings:
+                reading["position_interpolated"] = bool(
+                    reading["position_interpolated"]
+                )
+
+        if include_raw:
+            # Readings recorded before the archive existed keep their raw
+            # payload inline
+            ids = [result["reading_id"] for result in results]
+            archived = load_raw_data(conn, ids)
+            for reading, result in zip(readings, results):
+                raw_data = result["raw_data"] or archived.get(
+                    result["reading_id"], "{}"
+                )
+                reading["raw_data"] = json.loads(raw_data)
 
-        try:
-            cursor.execute(
-                """
-                SELECT *
-                FROM readings
-                WHERE altitude > 10000
-                ORDER BY timestamp ASC
+        return readings
+
+    def get_all_readings(
+        fields=READING_FIELDS, include_raw=False, where=None, params=(), limit=None
+    ):
+        """
+        Get all position data for the flight, or for a time window.
+
+        Only the given fields are read. Raw payloads are only decoded from the
+        archive if include_raw is set.
+
+        Args:
+            fields: Fields to include in each reading
+            include_raw: Whether to include each reading's raw payload
+            where: Condition from window_condition, or None for the whole
+                   flight
+            params: Parameters of the condition
+            limit: Maximum number of readings, or None for all of them
+        """
+        where = where or window_condition()[0]
+        query = f"{readings_query(fields, include_raw)} WHERE {where}"
+        query += " ORDER BY r.timestamp_ms ASC"
+        if limit is not None:
+            query += " LIMIT ?"
+            params = (*params, limit)
+        with get_database(FLIGHT_DB_PATH).reader() as conn:
+            results = conn.execute(query, params).fetchall()
+            return to_readings(conn, results, fields, include_raw)
+
+    def stream_all_readings(
+        fields=READING_FIELDS,
+        include_raw=False,
+        where=None,
+        params=(),
+        empty=NO_POSITION_DATA,
+    ):
+        """
+        Generate the JSON for get_all_readings a chunk at a time, reading
+        the rows as it goes, so memory use doesn't grow with the length of
+        the flight. If there are no readings, empty is sent instead.
+        """
+        where = where or window_condition()[0]
+        with get_database(FLIGHT_DB_PATH).reader() as conn:
+            conn.execute("BEGIN")
+            cursor = conn.execute(
+                f"""
+                {readings_query(fields, include_raw)}
+                WHERE {where}
+                ORDER BY r.timestamp_ms ASC
                 """,
+                params,
             )
-            results = cursor.fetchall()
-            if not results:
-                return {"status": "error", "message": "No position data available"}
-
-            readings = [
-                {
-                    "airline": current_app.config["AIRLINE"],
-                    "timestamp": result["timestamp"],
-                    "departure_airport": result["departure_airport"],
-                    "destination_airport": result["destination_airport"],
-                    "flight_number": result["flight_number"],
-                    "aircraft_type": result["aircraft_type"],
-                    "latitude": result["latitude"],
-                    "longitude": result["longitude"],
-                    "altitude": result["altitude"],
-                    "estimated_arrival_time": result["estimated_arrival_time"],
-                    "scheduled_departure_time": result["scheduled_departure_time"],
-                    "time_to_destination_minutes": result[
-                        "time_to_destination_minutes"
-                    ],
-                    "total_flight_time_minutes": result["total_flight_time_minutes"],
-                    "distance_to_destination": result["distance_to_destination"],
-                    "distance_from_origin": result["distance_from_origin"],
-                    "distance_traveled": result["distance_traveled"],
-                    "wind_speed": result["wind_speed"],
-                    "wind_direction": result["wind_direction"],
-                    "ground_speed": result["ground_speed"],
-                    "outside_air_temperature": result["outside_air_temperature"],
-                    "true_heading": result["true_heading"],
-                    "weight_on_wheels": result["weight_on_wheels"],
-                    "decompression": result["decompression"],
-                    "all_doors_closed": result["all_doors_closed"],
-                    "raw_data": json.loads(result["raw_data"]),
-                    "position_interpolated": False,  # Add flag for interpolated positions
-                    "position_source": "actual",  # Track source of position data
-                }
-                for result in results
-            ]
-
-            # Get the departure airport from the first reading
-            departure_airport = readings[0]["departure_airport"] if readings else None
-
-            # Interpolate any missing positions
-            readings = interpolate_missing_positions(readings, departure_airport)
-
-            return readings
-        finally:
-            conn.close()
+            with contextlib.closing(cursor):
+                results = cursor.fetchmany(RESPONSE_FETCH_SIZE)
+                if not results:
+                    yield dumps(empty)
+                    return
+
+                def readings(results):
+                    while results:
+                        yield from to_readings(conn, results, fields, include_raw)
+                        results = cursor.fetchmany(RESPONSE_FETCH_SIZE)
+
+                yield from json_array_chunks(readings(results))
+
+    def get_readings_since(since, fields=READING_FIELDS, include_raw=False):
+        """
+        Get the readings that are new or changed since a cursor.
+
+        A reading recorded since the cursor can land before readings the
+        client already has, if it arrived late, and that changes the
+        interpolated positions after it. So this returns every reading from
+        the earliest one that is new or whose position changed onwards,
+        which the client replaces its tail with. Only that stretch of the
+        flight is read from the database.
+
+        Args:
+            since: Cursor from the previous response, or 0 for everything
+            fields: Fields to include in each reading
+            include_raw: Whether to include each reading's raw payload
+
+        Returns:
+            Dictionary with the new cursor, the readings from the earliest
+            changed timestamp onwards, and whether the client should discard
+            what it has (if the cursor is from a different database)
+        """
+        with get_database(FLIGHT_DB_PATH).reader() as conn:
+            # Read everything from one snapshot, so rows committed while this
+            # runs are left for the next request rather than half-included
+            conn.execute("BEGIN")
+            cursor = readings_cursor(conn)
+            reset = since > cursor
+            if reset:
+                since = 0
+
+            earliest = earliest_change(conn, since)
+            if earliest is None:
+                return {"cursor": cursor, "reset": reset, "readings": []}
+
+            results = conn.execute(
+                f"""
+                {readings_query(fields, include_raw)}
+                WHERE r.altitude > 10000 AND r.timestamp_ms >= ?
+                ORDER BY r.timestamp_ms ASC
+                """,
+                (earliest,),
+            ).fetchall()
+            return {
+                "cursor": cursor,
+                "reset": reset,
+                "readings": to_readings(conn, results, fields, include_raw),
+            }
 
     @app.route("/readings")
     def readings():
-        """Endpoint to return all readings for the flight."""
-        # Check for dummy data parameter
-        return jsonify(get_all_readings())
+        """
+        Endpoint to return all readings for the flight.
+
+        Pass ?raw=1 to include each reading's raw payload. Pass ?since=<cursor>
+        to get only what changed since a previous response, along with a new
+        cursor; ?since=0 gets everything in that format. Pass ?format=columnar
+        to get the readings as one array per field (see to_columnar). Pass
+        ?fields=latitude,longitude,... to get only those fields, which are
+        all that is read from the database.
+
+        Pass ?from=<timestamp> and/or ?to=<timestamp> to get only the
+        readings in that window (inclusive), and ?limit=<n> to get them a page
+        at a time: when there may be more, the X-Next-Cursor header holds the
+        ?after=<timestamp> that gets the next page. Timestamps are epoch
+        milliseconds, like the readings', or ISO 8601.
+        """
+        include_raw = request.args.get("raw", "").lower() in ("1", "true")
+        try:
+            fields, raw_requested = parse_fields(request.args.get("fields"))
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        include_raw = include_raw or raw_requested
+        response_format = request.args.get("format", "rows")
+        if response_format not in READINGS_FORMATS:
+            return jsonify(
+                {"error": f"format must be one of {', '.join(READINGS_FORMATS)}"}
+            ), 400
+        since = request.args.get("since")
+        if since is not None:
+            try:
+                since = int(since)
+            except ValueError:
+                return jsonify({"error": "since must be an integer cursor"}), 400
+
+        try:
+            start, end, after = [
+                epoch_ms(request.args[name]) if name in request.args else None
+                for name in ("from", "to", "after")
+            ]
+        except ValueError:
+            return jsonify({"error": "from, to and after must be timestamps"}), 400
+        limit = request.args.get("limit")
+        if limit is not None:
+            try:
+                limit = int(limit)
+            except ValueError:
+                limit = 0
+            if limit < 1:
+                return jsonify({"error": "limit must be a positive integer"}), 400
+        window = any(value is not None for value in (start, end, after, limit))
+        if window and since is not None:
+            return jsonify(
+                {"error": "since can't be combined with from, to, after or limit"}
+            ), 400
+        where, params = window_condition(start, end, after)
+
+        # Most polls arrive when nothing has been recorded since the last one,
+        # so check the version before touching any row data
+        with get_database(FLIGHT_DB_PATH).reader() as conn:
+            etag = etag_for(readings_version(conn))
+        response = not_modified(etag)
+        if response is not None:
+            return response
+
+        if since is not None:
+            data = get_readings_since(since, fields, include_raw=include_raw)
+            if response_format == "columnar":
+                data["readings"] = to_columnar(data["readings"])
+            return with_etag(json_response(data), etag)
+
+        if response_format == "rows" and limit is None:
+            # Possibly the whole flight, which is streamed as it's read
+            response = streamed_json_response(
+                stream_all_readings(
+                    fields,
+                    include_raw=include_raw,
+                    where=where,
+                    params=params,
+                    empty=[] if window else NO_POSITION_DATA,
+                )
+            )
+            return with_etag(response, etag)
+
+        readings = get_all_readings(
+            fields, include_raw=include_raw, where=where, params=params, limit=limit
+        )
+        if not readings and not window:
+            data = NO_POSITION_DATA
+        elif response_format == "columnar":
+            data = to_columnar(readings)
+        else:
+            data = readings
+        response = json_response(data)
+        if limit is not None and len(readings) == limit:
+            response.headers["X-Next-Cursor"] = str(readings[-1]["timestamp"])
+        return with_etag(response, etag)
+
+    @app.route("/readings/series")
+    def readings_series():
+        """
+        Endpoint to return one metric's readings downsampled for a chart.
+
+        Pass ?metric=<name> (see series.SERIES_METRICS) and ?max_points=<n>,
+        usually the chart's width in pixels. The response is the same size
+        however long the flight is.
+        """
+        metric = request.args.get("metric")
+        if metric not in SERIES_METRICS:
+            return jsonify({"error": f"Unknown metric: {metric}"}), 400
+        try:
+            max_points = int(request.args.get("max_points", DEFAULT_SERIES_POINTS))
+        except ValueError:
+            return jsonify({"error": "max_points must be an integer"}), 400
+        if not 3 <= max_points <= MAX_SERIES_POINTS:
+            return jsonify(
+                {"error": f"max_points must be between 3 and {MAX_SERIES_POINTS}"}
+            ), 400
+
+        with get_database(FLIGHT_DB_PATH).reader() as conn:
+            # Read the version and the series from one snapshot, so the
+            # series is cached under the version it was built from
+            conn.execute("BEGIN")
+            version = readings_version(conn)
+            etag = etag_for(version)
+            response = not_modified(etag)
+            if response is not None:
+                return response
+
+            series = series_cache.get(metric, max_points, version)
+            if series is None:
+                rows = conn.execute(
+                    f"""
+                    SELECT r.timestamp_ms, {SERIES_METRICS[metric]} AS value
+                    FROM readings r
+                    LEFT JOIN positions p ON p.reading_id = r.id
+                    WHERE r.altitude > 10000 AND r.timestamp_ms IS NOT NULL
+                    ORDER BY r.timestamp_ms ASC
+                    """
+                ).fetchall()
+                series = {"metric": metric, **downsample(rows, max_points)}
+                series_cache.put(metric, max_points, version, series)
+
+        return with_etag(jsonify(series), etag)
+
+    @app.route("/readings/track")
+    def readings_track():
+        """
+        Endpoint to return the flight track simplified for a map zoom level.
+
+        Pass ?zoom=<k>, how far the map is zoomed in, and ?width=<pixels>, how
+        wide the whole world is at zoom 1. The simplified track is never more
+        than track.TRACK_TOLERANCE_PIXELS away from the full one on screen.
+        """
+        try:
+            zoom = float(request.args.get("zoom", 1))
+            width = float(request.args.get("width", DEFAULT_MAP_WIDTH))
+        except ValueError:
+            return jsonify({"error": "zoom and width must be numbers"}), 400
+        if not (zoom > 0 and width > 0):
+            return jsonify({"error": "zoom and width must be positive"}), 400
+
+        with get_database(FLIGHT_DB_PATH).reader() as conn:
+            conn.execute("BEGIN")
+            etag = etag_for(readings_version(conn))
+            response = not_modified(etag)
+            if response is not None:
+                return response
+            track.update(conn)
+
+        return with_etag(jsonify(track.simplify(tolerance_for_zoom(zoom, width))), etag)
+
+    @app.route("/readings/stream")
+    def readings_stream():
+        """
+        Server-Sent Events stream of readings as they are committed.
+
+        Each "readings" event carries the same delta as /readings?since=, with
+        the cursor as the event id, so a reconnecting EventSource resumes from
+        where it left off via Last-Event-ID. Pass ?since=<cursor> to start
+        from a cursor; the first event then catches up from there.
+        """
+        include_raw = request.args.get("raw", "").lower() in ("1", "true")
+        try:
+            since = int(
+                request.headers.get("Last-Event-ID") or request.args.get("since", 0)
+            )
+        except ValueError:
+            return jsonify({"error": "since must be an integer cursor"}), 400
+
+        def events():
+            # Subscribe before the first catch-up, so nothing committed in
+            # between is missed
+            subscription = broadcaster.subscribe()
+            cursor = since
+            try:
+                while True:
+                    delta = get_readings_since(cursor, include_raw=include_raw)
+                    if delta["readings"] or delta["reset"]:
+                        yield (
+                            f"id: {delta['cursor']}\n"
+                            f"event: readings\n"
+                            f"data: {dumps(delta).decode('utf-8')}\n\n"
+                        )
+                    cursor = delta["cursor"]
+
+                    # Any number of commits since the last delta are covered by
+                    # the next one
+                    while subscription.get(SSE_KEEPALIVE_INTERVAL) is None:
+                        yield ": keepalive\n\n"
+            finally:
+                broadcaster.unsubscribe(subscription)
+
+        response = Response(stream_with_context(events()), mimetype="text/event-stream")
+        response.headers["Cache-Control"] = "no-cache"
+        response.headers["X-Accel-Buffering"] = "no"
+        return response
+
+    if Sock is not None:
+        sock = Sock(app)
+
+        @sock.route("/ws")
+        def channel(ws):
+            """
+            WebSocket carrying live readings and ad-hoc queries over one
+            connection. See channel.Channel for the message format.
+            """
+            # Browsers don't apply CORS to WebSockets, so check the origin here
+            origin = request.headers.get("Origin")
+            if origin and not any(
+                re.fullmatch(pattern, origin) for pattern in ALLOWED_ORIGINS
+            ):
+                ws.close(reason=1008, message="Origin not allowed")
+                return
+
+            app_ = current_app._get_current_object()
+
+            def readings_since(cursor, include_raw):
+                # Runs on the channel's own threads, outside this request
+                with app_.app_context():
+                    return get_readings_since(cursor, include_raw=include_raw)
+
+            Channel(ws, broadcaster, readings_since, run_query).run()
+
+    @app.route("/readings/<int:reading_id>/raw")
+    def reading_raw(reading_id):
+        """Endpoint to return the raw payload recorded for one reading."""
+        with get_database(FLIGHT_DB_PATH).reader() as conn:
+            row = conn.execute(
+                "SELECT raw_data FROM readings WHERE id = ?", (reading_id,)
+            ).fetchone()
+            if row is None:
+                return jsonify({"error": "No such reading"}), 404
+            raw_data = row["raw_data"] or load_raw_data(conn, [reading_id]).get(
+                reading_id, "{}"
+            )
+        return jsonify(json.loads(raw_data))
 
     @app.route("/query", methods=["POST"])
     def query():
         """Execute a custom query on the flight data."""
-        conn = sqlite3.connect("anon_data.db")
-        conn.row_factory = sqlite3.Row
-        cursor = conn.cursor()
-
         try:
             query_data = request.get_json()
             query = query_data.get("query", "")
 
-            # Execute the query
-            cursor.execute(query)
-            results = [dict(row) for row in cursor.fetchall()]
-
-            # Return in the format expected by the frontend
-            return jsonify(results)
+            # Return in the format expected by the frontend, streamed as the
+            # rows are read
+            return streamed_json_response(json_array_chunks(query_rows(query)))
 
         except sqlite3.Error as e:
             print(e)
@@ -380,21 +1097,50 @@ def create_app(airline=None):
         except Exception as e:
             print(e)
             return jsonify({"error": str(e)}), 500
-        finally:
-            conn.close()
 
     @app.route("/record", methods=["POST"])
     def record():
         """Record readings."""
         try:
-            data = request.get_json()
+            data = read_json_body()
             content = data.get("content")
 
+            # Skip exact repeats of a payload this recorder recently sent
+            source = recorder_source()
+            digest = deduplicator.check(source, dedup_payload(content))
+            if digest is None:
+                return jsonify(
+                    {
+                        "status": "duplicate",
+                        "message": "Content was already recorded",
+                    }
+                ), 200
+
             # Parse the content
-            parsed_data = parse_for_airline(content)
+            parsed_data = parse_for_airline(content, current_app.config["AIRLINE"])
+
+            if ingest_queue is not None:
+                if parsed_data["timestamp"] is None:
+                    raise ValueError("Missing timestamp")
+                check_storable(parsed_data)
+                try:
+                    # Only remember the payload once it has been committed, so
+                    # a resend after a failed write isn't skipped as a repeat
+                    ingest_queue.put(
+                        parsed_data, lambda: deduplicator.remember(source, digest)
+                    )
+                except queue.Full:
+                    return jsonify({"error": "Ingest queue is full"}), 503
+                return jsonify(
+                    {
+                        "status": "queued",
+                        "message": "Content queued to be recorded to database",
+                    }
+                ), 202
 
             # Write to database
             write_to_readings(parsed_data)
+            deduplicator.remember(source, digest)
 
             return jsonify(
                 {
@@ -402,49 +1148,217 @@ def create_app(airline=None):
                     "message": "Content successfully recorded to database",
                 }
             ), 200
+        except UnsupportedEncoding as e:
+            return unsupported_encoding(e)
         except Exception as e:
             print(e)
             return jsonify({"error": str(e)}), 400
 
+    def record_contents(contents, source):
+        """
+        Parse and record many contents in a single transaction.
+
+        Returns:
+            Result for each content, with status "recorded", "duplicate" or
+            "error"
+        """
+        # Parse everything up front so one bad item doesn't sink the batch
+        results = [{"index": i, "status": "error"} for i in range(len(contents))]
+        batch = []
+        batch_indexes = []
+        batch_digests = []
+        seen_digests = set()
+        for i, content in enumerate(contents):
+            try:
+                # Skip exact repeats, including repeats within this batch
+                digest = deduplicator.check(source, dedup_payload(content))
+                if digest is None or digest in seen_digests:
+                    results[i]["status"] = "duplicate"
+                    continue
+                seen_digests.add(digest)
+                parsed_data = parse_for_airline(content, current_app.config["AIRLINE"])
+                if parsed_data["timestamp"] is None:
+                    raise ValueError("Missing timestamp")
+                check_storable(parsed_data)
+            except Exception as e:
+                results[i]["error"] = str(e)
+                continue
+            batch.append(parsed_data)
+            batch_indexes.append(i)
+            batch_digests.append(digest)
+
+        statuses = write_batch_to_readings(batch)
+
+        for i, digest, status in zip(batch_indexes, batch_digests, statuses):
+            results[i]["status"] = status
+            if status == "error":
+                results[i]["error"] = "Could not be written to the database"
+                continue
+            deduplicator.remember(source, digest)
+
+        return results
+
+    @app.route("/record/batch", methods=["POST"])
+    def record_batch():
+        """Record many readings in a single transaction."""
+        try:
+            contents = read_batch_contents()
+        except UnsupportedEncoding as e:
+            return unsupported_encoding(e)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+
+        try:
+            results = record_contents(contents, recorder_source())
+        except Exception as e:
+            print(e)
+            return jsonify({"error": str(e)}), 400
+
+        counts = {"recorded": 0, "duplicate": 0, "error": 0}
+        for result in results:
+            counts[result["status"]] += 1
+
+        return jsonify(
+            {
+                "status": "success",
+                "recorded": counts["recorded"],
+                "duplicates": counts["duplicate"],
+                "errors": counts["error"],
+                "results": results,
+            }
+        ), 200
+
+    @app.route("/record/stream", methods=["POST"])
+    def record_stream():
+        """
+        Record readings from an NDJSON body, one content object per line.
+
+        The body is read incrementally and readings are committed every
+        STREAM_BATCH_SIZE lines while the upload is still arriving, so memory
+        use doesn't grow with the size of the upload.
+        """
+        try:
+            body = request_body()
+        except UnsupportedEncoding as e:
+            return unsupported_encoding(e)
+
+        source = recorder_source()
+        counts = {"recorded": 0, "duplicate": 0, "error": 0}
+        errors = []
+        contents = []
+        content_lines = []
+
+        def add_error(line_number, message):
+            counts["error"] += 1
+            if len(errors) < MAX_STREAM_ERRORS:
+                errors.append({"line": line_number, "error": message})
+
+        def flush():
+            results = record_contents(contents, source)
+            for line_number, result in zip(content_lines, results):
+                if result["status"] == "error":
+                    add_error(line_number, result["error"])
+                else:
+                    counts[result["status"]] += 1
+            contents.clear()
+            content_lines.clear()
+
+        try:
+            for line_number, line in enumerate(body, start=1):
+                if not line.strip():
+                    continue
+                try:
+                    contents.append(json.loads(line))
+                except ValueError as e:
+                    add_error(line_number, str(e))
+                    continue
+                content_lines.append(line_number)
+
+                if len(contents) >= STREAM_BATCH_SIZE:
+                    flush()
+            if contents:
+                flush()
+        except Exception as e:
+            # Everything before the failed transaction is already committed
+            print(e)
+            return jsonify(
+                {
+                    "error": str(e),
+                    "recorded": counts["recorded"],
+                    "duplicates": counts["duplicate"],
+                    "errors": counts["error"],
+                }
+            ), 400
+
+        return jsonify(
+            {
+                "status": "success",
+                "recorded": counts["recorded"],
+                "duplicates": counts["duplicate"],
+                "errors": counts["error"],
+                "error_details": errors,
+            }
+        ), 200
+
+    @app.route("/ingest/stats")
+    def ingest_stats():
+        """
+        Return the ingest mode, payload dedup hit rate, live stream
+        subscribers, and queue depth and commit latency if async.
+        """
+        stats = {
+            "mode": current_app.config["INGEST_MODE"],
+            "dedup": deduplicator.stats(),
+            "stream": broadcaster.stats(),
+        }
+        if ingest_queue is not None:
+            stats.update(ingest_queue.stats())
+        return jsonify(stats)
+
     @app.route("/schema")
     def schema():
         """Return the database schema in the format expected by the frontend."""
-        conn = sqlite3.connect("anon_data.db")
-        cursor = conn.cursor()
-
         try:
-            # Get all tables
-            cursor.execute("""
-                SELECT name 
-                FROM sqlite_master 
-                WHERE type='table'
-                ORDER BY name
-            """)
-            tables = cursor.fetchall()
-
-            # Build schema object matching frontend interface
-            schema = {}
-            for (table_name,) in tables:
-                cursor.execute(f"PRAGMA table_info({table_name})")
-                columns = cursor.fetchall()
-
-                # Format columns to match frontend ColumnInfo interface
-                schema[table_name] = [
-                    {
-                        "name": col[1],
-                        "type": col[2],
-                        "notnull": bool(col[3]),
-                        "pk": bool(col[5]),
-                    }
-                    for col in columns
-                ]
-
-            return jsonify(schema)
+            with get_database(QUERY_DB_PATH).reader() as conn:
+                # The schema version changes on every CREATE, DROP or ALTER
+                (schema_version,) = conn.execute("PRAGMA schema_version").fetchone()
+                etag = etag_for(f"schema-{schema_version}")
+                response = not_modified(etag)
+                if response is not None:
+                    return response
+
+                cursor = conn.cursor()
+
+                # Get all tables
+                cursor.execute("""
+                    SELECT name 
+                    FROM sqlite_master 
+                    WHERE type='table'
+                    ORDER BY name
+                """)
+                tables = cursor.fetchall()
+
+                # Build schema object matching frontend interface
+                schema = {}
+                for (table_name,) in tables:
+                    cursor.execute(f"PRAGMA table_info({table_name})")
+                    columns = cursor.fetchall()
+
+                    # Format columns to match frontend ColumnInfo interface
+                    schema[table_name] = [
+                        {
+                            "name": col[1],
+                            "type": col[2],
+                            "notnull": bool(col[3]),
+                            "pk": bool(col[5]),
+                        }
+                        for col in columns
+                    ]
+
+            return with_etag(jsonify(schema), etag)
 
         except sqlite3.Error as e:
             return jsonify({"error": f"Database error: {str(e)}"}), 500
-        finally:
-            conn.close()
 
     return app
 
@@ -463,10 +1377,42 @@ def main():
         default="127.0.0.1",
         help="Host to run the server on (default: 127.0.0.1)",
     )
+    parser.add_argument(
+        "--ingest-mode",
+        choices=["sync", "async"],
+        default="sync",
+        help="Write each reading before responding (sync), or queue readings "
+        "and commit them in groups in the background (async) (default: sync)",
+    )
+    parser.add_argument(
+        "--ingest-batch-size",
+        type=int,
+        default=DEFAULT_BATCH_SIZE,
+        help=f"Maximum readings per group commit in async mode "
+        f"(default: {DEFAULT_BATCH_SIZE})",
+    )
+    parser.add_argument(
+        "--ingest-window-ms",
+        type=float,
+        default=DEFAULT_WINDOW * 1000,
+        help=f"Maximum time to wait for more readings before a group commit in "
+        f"async mode (default: {DEFAULT_WINDOW * 1000:g})",
+    )
     args = parser.parse_args()
 
-    app = create_app(airline=args.airline)
-    app.run(host=args.host, port=args.port)
+    app = create_app(
+        airline=args.airline,
+        ingest_mode=args.ingest_mode,
+        ingest_batch_size=args.ingest_batch_size,
+        ingest_window=args.ingest_window_ms / 1000,
+    )
+    try:
+        app.run(host=args.host, port=args.port)
+    finally:
+        # Write everything that was acknowledged before closing the database
+        if app.extensions["ingest_queue"] is not None:
+            app.extensions["ingest_queue"].stop()
+        close_all()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,190 @@
+import argparse
+import os
+import sqlite3
+import zlib
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from db import chunked_lookup
+
+# Every KEYFRAME_INTERVAL-th payload is compressed on its own; the payloads in
+# between are compressed using the previous keyframe as a shared dictionary, so
+# any payload can be decoded with at most two decompressions
+KEYFRAME_INTERVAL = 64
+COMPRESSION_LEVEL = 9
+
+
+def setup_archive(conn: sqlite3.Connection) -> None:
+    """Create the raw payload archive table if it doesn't exist."""
+    conn.execute("""CREATE TABLE IF NOT EXISTS raw_archive
+                (reading_id INTEGER PRIMARY KEY,
+                 keyframe_id INTEGER,
+                 payload BLOB NOT NULL)""")
+
+
+def _compress(raw: bytes, keyframe: Optional[bytes]) -> bytes:
+    if keyframe is None:
+        return zlib.compress(raw, COMPRESSION_LEVEL)
+    compressor = zlib.compressobj(COMPRESSION_LEVEL, zdict=keyframe)
+    return compressor.compress(raw) + compressor.flush()
+
+
+def _decompress(payload: bytes, keyframe: Optional[bytes]) -> bytes:
+    if keyframe is None:
+        return zlib.decompress(payload)
+    decompressor = zlib.decompressobj(zdict=keyframe)
+    return decompressor.decompress(payload) + decompressor.flush()
+
+
+def _latest_keyframe(
+    conn: sqlite3.Connection,
+) -> Tuple[Optional[int], Optional[bytes], int]:
+    """Get the id and payload of the latest keyframe, and how many payloads
+    (including itself) have been archived since."""
+    row = conn.execute("""
+        SELECT reading_id, payload
+        FROM raw_archive
+        WHERE keyframe_id IS NULL
+        ORDER BY reading_id DESC
+        LIMIT 1
+    """).fetchone()
+    if row is None:
+        return None, None, 0
+
+    keyframe_id, payload = row[0], row[1]
+    (count,) = conn.execute(
+        "SELECT COUNT(*) FROM raw_archive WHERE reading_id >= ?", (keyframe_id,)
+    ).fetchone()
+    return keyframe_id, _decompress(payload, None), count
+
+
+def archive_raw_data(
+    conn: sqlite3.Connection, payloads: Iterable[Tuple[int, str]]
+) -> None:
+    """
+    Compress and store raw payloads in the archive.
+
+    Args:
+        conn: Connection to write with, inside the caller's transaction
+        payloads: (reading id, raw payload text) pairs, in increasing reading
+                  id order
+    """
+    keyframe_id, keyframe, count = _latest_keyframe(conn)
+
+    rows = []
+    for reading_id, raw in payloads:
+        raw_bytes = raw.encode("utf-8")
+        if keyframe is None or count >= KEYFRAME_INTERVAL:
+            rows.append((reading_id, None, _compress(raw_bytes, None)))
+            keyframe_id, keyframe, count = reading_id, raw_bytes, 1
+        else:
+            rows.append((reading_id, keyframe_id, _compress(raw_bytes, keyframe)))
+            count += 1
+
+    conn.executemany(
+        "INSERT OR REPLACE INTO raw_archive (reading_id, keyframe_id, payload) "
+        "VALUES (?, ?, ?)",
+        rows,
+    )
+
+
+def load_raw_data(conn: sqlite3.Connection, reading_ids: List[int]) -> Dict[int, str]:
+    """
+    Decode the archived raw payloads of some readings.
+
+    Returns:
+        Raw payload text by reading id, for every reading that has one
+    """
+    rows = chunked_lookup(
+        conn,
+        "SELECT reading_id, keyframe_id, payload FROM raw_archive "
+        "WHERE reading_id IN ({placeholders})",
+        reading_ids,
+    )
+    frames = {
+        reading_id: (keyframe_id, payload) for reading_id, keyframe_id, payload in rows
+    }
+
+    # Decode each keyframe that's needed once
+    keyframe_ids = sorted(
+        {keyframe_id for keyframe_id, _ in frames.values() if keyframe_id is not None}
+        - set(frames)
+    )
+    rows = chunked_lookup(
+        conn,
+        "SELECT reading_id, payload FROM raw_archive "
+        "WHERE reading_id IN ({placeholders})",
+        keyframe_ids,
+    )
+    keyframes = {reading_id: _decompress(payload, None) for reading_id, payload in rows}
+    for reading_id, (keyframe_id, payload) in frames.items():
+        if keyframe_id is None:
+            keyframes[reading_id] = _decompress(payload, None)
+
+    raw_data = {}
+    for reading_id, (keyframe_id, payload) in frames.items():
+        if keyframe_id is None:
+            raw_bytes = keyframes[reading_id]
+        else:
+            raw_bytes = _decompress(payload, keyframes[keyframe_id])
+        raw_data[reading_id] = raw_bytes.decode("utf-8")
+    return raw_data
+
+
+def migrate_raw_data(conn: sqlite3.Connection, chunk_size: int = 1000) -> int:
+    """
+    Move raw payloads stored inline in the readings table into the archive.
+
+    Returns:
+        Number of payloads moved
+    """
+    setup_archive(conn)
+    moved = 0
+    last_id = 0
+    while True:
+        rows = conn.execute(
+            """
+            SELECT id, raw_data
+            FROM readings
+            WHERE id > ? AND raw_data IS NOT NULL
+            ORDER BY id
+            LIMIT ?
+            """,
+            (last_id, chunk_size),
+        ).fetchall()
+        if not rows:
+            return moved
+
+        archive_raw_data(conn, [(row[0], row[1]) for row in rows])
+        last_id = rows[-1][0]
+        conn.execute(
+            "UPDATE readings SET raw_data = NULL WHERE id > ? AND id <= ?",
+            (rows[0][0] - 1, last_id),
+        )
+        moved += len(rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Move raw payloads into the compressed archive"
+    )
+    parser.add_argument(
+        "--db-path", default="flight_data.db", help="Path to the SQLite database"
+    )
+    args = parser.parse_args()
+
+    size_before = os.path.getsize(args.db_path)
+    conn = sqlite3.connect(args.db_path)
+    moved = migrate_raw_data(conn)
+    conn.commit()
+    conn.execute("VACUUM")
+    conn.close()
+    size_after = os.path.getsize(args.db_path)
+
+    print(
+        f"Archived {moved} raw payloads, "
+        f"database size {size_before:,} -> {size_after:,} bytes"
+    )
+
+
+if __name__ == "__main__":
+    main()
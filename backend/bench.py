@@ -0,0 +1,273 @@
+import argparse
+import contextlib
+import json
+import os
+import random
+import sqlite3
+import tempfile
+import time
+from typing import Any, Callable, Dict, Iterator, List
+
+from flask import Flask
+
+from app import (
+    _insert_sql,
+    create_app,
+    parse_for_airline,
+    to_columnar,
+)
+from archive import archive_raw_data, load_raw_data, setup_archive
+from db import close_all
+from demo_data import generate_demo_data, setup_database, write_demo_data_to_db
+from parsers import epoch_ms, get_parser, registered_airlines
+from positions import calculate_new_position, dead_reckon_gap
+
+EXAMPLE_BA_PATH = os.path.join(
+    os.path.dirname(__file__), "..", "frontend", "src", "app", "data", "example_ba.json"
+)
+
+
+def _time_per_item(func: Callable[[], int], repeat: int = 3) -> float:
+    """Run func (which returns how many items it processed) and get the best
+    time per item in microseconds."""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        count = func()
+        best = min(best, (time.perf_counter() - start) / count)
+    return best * 1e6
+
+
+def _temp_database() -> sqlite3.Connection:
+    path = os.path.join(tempfile.mkdtemp(), "bench.db")
+    setup_database(path)
+    return sqlite3.connect(path)
+
+
+def _bench_records(num_points: int) -> List[Dict[str, Any]]:
+    # With timestamp_ms added, as the write functions do
+    records = []
+    for point in generate_demo_data("BENCH", "", num_points):
+        parsed_data = parse_for_airline(point)
+        parsed_data["timestamp_ms"] = epoch_ms(parsed_data["timestamp"])
+        records.append(parsed_data)
+    return records
+
+
+def bench_insert(args):
+    """Per-record cost of building and executing the readings INSERT."""
+    records = _bench_records(args.num_points)
+
+    def uncached(conn):
+        def run():
+            conn.execute("DELETE FROM readings")
+            for parsed_data in records:
+                # The SQL as write_to_readings used to build it on every call
+                fields = list(parsed_data.keys())
+                placeholders = ",".join(["?" for _ in fields])
+                sql = (
+                    f"INSERT INTO readings ({','.join(fields)}) VALUES ({placeholders})"
+                )
+                conn.execute(sql, list(parsed_data.values()))
+            return len(records)
+
+        return run
+
+    def cached(conn):
+        def run():
+            conn.execute("DELETE FROM readings")
+            for parsed_data in records:
+                conn.execute(
+                    _insert_sql(tuple(parsed_data)), tuple(parsed_data.values())
+                )
+            return len(records)
+
+        return run
+
+    # Everything runs in one transaction so the per-record cost isn't hidden
+    # behind commits
+    for name, make_run in [("uncached", uncached), ("cached", cached)]:
+        conn = _temp_database()
+        print(f"{name:>10}: {_time_per_item(make_run(conn)):8.2f} us/record")
+        conn.rollback()
+        conn.close()
+
+
+def _sample_contents(airline: str, num_points: int) -> List[Dict[str, Any]]:
+    """Recorded contents to benchmark an airline's parser with."""
+    if airline == "BA":
+        # As captured by the Firefox recorder
+        with open(EXAMPLE_BA_PATH) as f:
+            raw = f.read()
+        return [{"raw": raw, "timestamp": i} for i in range(num_points)]
+    return generate_demo_data(airline, "", num_points)
+
+
+def bench_parse(args):
+    """Records parsed per second by each registered airline parser."""
+    for airline in registered_airlines():
+        contents = _sample_contents(airline, args.num_points)
+        parser = get_parser(airline)
+
+        def run():
+            for content in contents:
+                parser(content)
+            return len(contents)
+
+        per_record = _time_per_item(run)
+        print(f"{airline:>10}: {1e6 / per_record:12,.0f} records/s")
+
+
+def _long_flight_payloads(num_points: int) -> List[str]:
+    """BA portal payloads for a long flight, one every 5 seconds."""
+    with open(EXAMPLE_BA_PATH) as f:
+        example = json.load(f)
+
+    payloads = []
+    for i in range(num_points):
+        progress = i / max(num_points - 1, 1)
+        payload = dict(example)
+        payload.update(
+            {
+                "altitude": 36000 + (i * 37) % 400,
+                "groundSpeed": 450 + (i * 13) % 40,
+                "outsideAirTemperature": -50 + (i * 7) % 10,
+                "trueHeading": 280 + (i * 3) % 20,
+                "windDirection": (i * 11) % 360,
+                "windSpeed": 20 + (i * 17) % 40,
+                "distanceToDestination": round(5500 * (1 - progress), 1),
+                "timeToDestinationMinutes": round(660 * (1 - progress)),
+                "latitude": round(41.8 + 10 * progress, 4),
+                "longitude": round(12.2 - 80 * progress, 4),
+                "weightOnWheels": False,
+            }
+        )
+        payloads.append(json.dumps(payload))
+    return payloads
+
+
+def bench_archive(args):
+    """On-disk size of raw payloads stored inline versus in the archive."""
+    payloads = _long_flight_payloads(args.num_points)
+    sizes = {}
+    for name in ["inline", "archive"]:
+        conn = _temp_database()
+        setup_archive(conn)
+        rows = [(str(i), payload) for i, payload in enumerate(payloads)]
+        if name == "inline":
+            conn.executemany(
+                "INSERT INTO readings (timestamp, raw_data) VALUES (?, ?)", rows
+            )
+        else:
+            conn.executemany(
+                "INSERT INTO readings (timestamp) VALUES (?)", [(t,) for t, _ in rows]
+            )
+            archive_raw_data(
+                conn, [(i + 1, payload) for i, payload in enumerate(payloads)]
+            )
+            # Make sure everything round-trips
+            ids = list(range(1, len(payloads) + 1))
+            assert list(load_raw_data(conn, ids).values()) == payloads
+        conn.commit()
+        conn.execute("VACUUM")
+        (path,) = [row[2] for row in conn.execute("PRAGMA database_list")]
+        conn.close()
+        sizes[name] = os.path.getsize(path)
+        print(f"{name:>10}: {sizes[name]:12,} bytes")
+
+    print(f"{'saved':>10}: {1 - sizes['archive'] / sizes['inline']:12.1%}")
+
+
+@contextlib.contextmanager
+def _demo_app(num_points: int) -> Iterator[Flask]:
+    """The app, serving a demo flight from a temporary directory."""
+    # The app reads flight_data.db from the working directory
+    cwd = os.getcwd()
+    os.chdir(tempfile.mkdtemp())
+    try:
+        write_demo_data_to_db("flight_data.db", "BENCH", "", num_points)
+        yield create_app(airline="BENCH")
+    finally:
+        close_all()
+        os.chdir(cwd)
+
+
+def bench_columnar(args):
+    """Size and serialize time of /readings as rows versus columnar."""
+    with _demo_app(args.num_points) as app:
+        with app.test_client() as client:
+            readings = client.get("/readings").get_json()
+
+        formats = {
+            "rows": lambda: readings,
+            "columnar": lambda: to_columnar(readings),
+        }
+        with app.app_context():
+            for name, build in formats.items():
+
+                def run():
+                    app.json.dumps(build())
+                    return len(readings)
+
+                size = len(app.json.dumps(build()).encode("utf-8"))
+                serialize_ms = _time_per_item(run) * len(readings) / 1000
+                print(f"{name:>10}: {size:12,} bytes {serialize_ms:8.1f} ms")
+        print(f"{'readings':>10}: {len(readings):12,}")
+
+
+def bench_reckon(args):
+    """
+    Per-reading cost of dead-reckoning a long gap without GPS, one reading at
+    a time versus a gap at once.
+    """
+    rng = random.Random(0)
+    count = args.num_points
+    headings = [rng.uniform(0, 360) for _ in range(count)]
+    speeds = [rng.uniform(350, 550) for _ in range(count)]
+    elapsed_times = [rng.uniform(5, 60) / 3600 for _ in range(count)]
+
+    def per_reading():
+        # What InterpolationState did for every reading of a gap
+        lat, lon = 51.47, -0.4543
+        positions = []
+        for heading, speed, elapsed_time in zip(headings, speeds, elapsed_times):
+            new_lat, new_lon = calculate_new_position(
+                lat, lon, heading, speed, elapsed_time
+            )
+            lat, lon = round(new_lat, 4), round(new_lon, 4)
+            positions.append((lat, lon))
+        return positions
+
+    def gap():
+        return dead_reckon_gap(51.47, -0.4543, headings, speeds, elapsed_times)
+
+    for name, func in [("per reading", per_reading), ("gap", gap)]:
+        per_item = _time_per_item(lambda: len(func()))
+        print(f"{name:>12}: {per_item:8.2f} us/reading")
+
+
+BENCHMARKS = {
+    "archive": bench_archive,
+    "columnar": bench_columnar,
+    "insert": bench_insert,
+    "parse": bench_parse,
+    "reckon": bench_reckon,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Backend micro-benchmarks")
+    parser.add_argument("benchmark", choices=sorted(BENCHMARKS))
+    parser.add_argument(
+        "--num-points",
+        type=int,
+        default=10000,
+        help="Number of readings to benchmark with (default: 10000)",
+    )
+    args = parser.parse_args()
+
+    BENCHMARKS[args.benchmark](args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+import queue
+import threading
+from typing import Any, Dict, List, Optional
+
+from db import Database
+
+# Default number of undelivered events held per subscriber
+DEFAULT_SUBSCRIBER_QUEUE_SIZE = 16
+
+
+class Subscription:
+    """
+    One subscriber's bounded queue of events.
+
+    Publishing never blocks: if the subscriber has fallen behind and its
+    queue is full, the oldest event is dropped to make room. Subscribers are
+    expected to treat events as "something changed" and catch up from their
+    own cursor, so dropped events coalesce into the next one rather than
+    losing data.
+    """
+
+    def __init__(self, size: int = DEFAULT_SUBSCRIBER_QUEUE_SIZE):
+        self._queue: "queue.Queue[Any]" = queue.Queue(maxsize=size)
+        self.dropped = 0
+
+    def put(self, event: Any) -> None:
+        while True:
+            try:
+                self._queue.put_nowait(event)
+                return
+            except queue.Full:
+                try:
+                    self._queue.get_nowait()
+                    self.dropped += 1
+                except queue.Empty:
+                    pass
+
+    def get(self, timeout: float) -> Optional[List[Any]]:
+        """
+        Wait for events.
+
+        Returns:
+            Every event queued so far, oldest first, or None if nothing
+            arrived within the timeout
+        """
+        try:
+            events = [self._queue.get(timeout=timeout)]
+        except queue.Empty:
+            return None
+        while True:
+            try:
+                events.append(self._queue.get_nowait())
+            except queue.Empty:
+                return events
+
+
+class Broadcaster:
+    """Fans published events out to every current subscriber."""
+
+    def __init__(self, subscriber_queue_size: int = DEFAULT_SUBSCRIBER_QUEUE_SIZE):
+        self.subscriber_queue_size = subscriber_queue_size
+        self._subscriptions: List[Subscription] = []
+        self._lock = threading.Lock()
+        self._published = 0
+
+    def subscribe(self) -> Subscription:
+        """Start receiving events. Call `unsubscribe` when done."""
+        subscription = Subscription(self.subscriber_queue_size)
+        with self._lock:
+            self._subscriptions.append(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        """Stop receiving events."""
+        with self._lock:
+            if subscription in self._subscriptions:
+                self._subscriptions.remove(subscription)
+
+    def publish(self, event: Any = None) -> None:
+        """Send an event to every subscriber, without ever blocking."""
+        with self._lock:
+            subscriptions = list(self._subscriptions)
+            self._published += 1
+        for subscription in subscriptions:
+            subscription.put(event)
+
+    def stats(self) -> Dict[str, Any]:
+        """Get the number of subscribers and of events published and dropped."""
+        with self._lock:
+            return {
+                "subscribers": len(self._subscriptions),
+                "published": self._published,
+                "dropped": sum(s.dropped for s in self._subscriptions),
+            }
+
+
+_broadcasters_lock = threading.Lock()
+
+
+def commit_broadcaster(database: Database) -> Broadcaster:
+    """
+    Get the broadcaster that publishes an event after every commit to a
+    database, creating it on first use.
+
+    There is one per database, however many apps serve it, so its commit
+    listener is only ever added once.
+    """
+    with _broadcasters_lock:
+        broadcaster = database.extensions.get("broadcaster")
+        if broadcaster is None:
+            broadcaster = database.extensions["broadcaster"] = Broadcaster()
+            database.add_commit_listener(broadcaster.publish)
+        return broadcaster
@@ -0,0 +1,198 @@
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Tuple
+
+from broadcast import Broadcaster, Subscription
+from serialization import dumps
+
+# Maximum number of queries run at once on one connection; more wait their turn
+MAX_CONCURRENT_QUERIES = 4
+# Seconds a subscription waits for a commit before checking it wasn't cancelled
+SUBSCRIPTION_POLL_INTERVAL = 15
+
+ReadingsSince = Callable[[int, bool], Dict[str, Any]]
+RunQuery = Callable[[str, threading.Event], List[Dict[str, Any]]]
+
+
+class Channel:
+    """
+    One WebSocket connection multiplexing live readings and ad-hoc queries.
+
+    Every message is a JSON object with a client-chosen "id" and a "type".
+    The client sends:
+
+        {"id": ..., "type": "subscribe", "since": <cursor>, "raw": false}
+        {"id": ..., "type": "query", "query": "SELECT ..."}
+        {"id": ..., "type": "cancel"}
+
+    and the server answers with messages carrying the same id:
+
+        {"id": ..., "type": "readings", "cursor": ..., "reset": ...,
+         "readings": [...]}  -- one per delta, like /readings?since=
+        {"id": ..., "type": "result", "rows": [...]}
+        {"id": ..., "type": "error", "error": "..."}
+        {"id": ..., "type": "cancelled"}
+
+    Cancelling a running query interrupts it inside SQLite; cancelling a
+    subscription stops its deltas.
+    """
+
+    def __init__(
+        self,
+        ws: Any,
+        broadcaster: Broadcaster,
+        readings_since: ReadingsSince,
+        run_query: RunQuery,
+    ):
+        """
+        Args:
+            ws: The connection, with blocking send() and receive()
+            broadcaster: Broadcaster woken after every readings commit
+            readings_since: Function from a cursor and whether to include raw
+                            payloads to a readings delta
+            run_query: Function that runs a query on the query database,
+                       aborting once the given event is set
+        """
+        self.ws = ws
+        self.broadcaster = broadcaster
+        self.readings_since = readings_since
+        self.run_query = run_query
+
+        self._send_lock = threading.Lock()
+        self._lock = threading.Lock()
+        self._queries: Dict[Any, threading.Event] = {}
+        self._subscriptions: Dict[Any, Tuple[Subscription, threading.Event]] = {}
+        self._executor = ThreadPoolExecutor(
+            max_workers=MAX_CONCURRENT_QUERIES, thread_name_prefix="channel-query"
+        )
+
+    def send(self, message: Dict[str, Any]) -> None:
+        """Send a message, from whichever thread produced it."""
+        data = dumps(message).decode("utf-8")
+        with self._send_lock:
+            self.ws.send(data)
+
+    def run(self) -> None:
+        """Handle messages until the client disconnects."""
+        try:
+            while True:
+                data = self.ws.receive()
+                if data is None:
+                    return
+                self.handle(data)
+        finally:
+            self.close()
+
+    def handle(self, data: str) -> None:
+        """Dispatch one message from the client."""
+        try:
+            message = json.loads(data)
+            request_id = message.get("id")
+            message_type = message.get("type")
+        except (ValueError, AttributeError):
+            self.send({"id": None, "type": "error", "error": "Invalid message"})
+            return
+
+        if message_type == "subscribe":
+            self._subscribe(request_id, message)
+        elif message_type == "query":
+            self._query(request_id, message.get("query", ""))
+        elif message_type == "cancel":
+            self._cancel(request_id)
+        else:
+            self.send(
+                {
+                    "id": request_id,
+                    "type": "error",
+                    "error": f"Unknown message type: {message_type}",
+                }
+            )
+
+    def close(self) -> None:
+        """Cancel every running query and subscription."""
+        with self._lock:
+            request_ids = list(self._queries) + list(self._subscriptions)
+        for request_id in request_ids:
+            self._cancel(request_id, notify=False)
+        self._executor.shutdown(wait=False)
+
+    def _query(self, request_id: Any, query: str) -> None:
+        cancelled = threading.Event()
+        with self._lock:
+            self._queries[request_id] = cancelled
+
+        def run():
+            try:
+                if cancelled.is_set():
+                    return
+                rows = self.run_query(query, cancelled)
+                self.send({"id": request_id, "type": "result", "rows": rows})
+            except Exception as e:
+                if not cancelled.is_set():
+                    print(e)
+                    self.send({"id": request_id, "type": "error", "error": str(e)})
+            finally:
+                with self._lock:
+                    if self._queries.get(request_id) is cancelled:
+                        del self._queries[request_id]
+
+        self._executor.submit(run)
+
+    def _subscribe(self, request_id: Any, message: Dict[str, Any]) -> None:
+        try:
+            cursor = int(message.get("since") or 0)
+        except (TypeError, ValueError):
+            self.send(
+                {
+                    "id": request_id,
+                    "type": "error",
+                    "error": "since must be an integer cursor",
+                }
+            )
+            return
+        include_raw = bool(message.get("raw"))
+
+        # Subscribe before the first catch-up, so nothing committed in between
+        # is missed
+        subscription = self.broadcaster.subscribe()
+        stopped = threading.Event()
+        with self._lock:
+            self._subscriptions[request_id] = (subscription, stopped)
+
+        def run():
+            nonlocal cursor
+            try:
+                while not stopped.is_set():
+                    delta = self.readings_since(cursor, include_raw)
+                    if delta["readings"] or delta["reset"]:
+                        self.send({"id": request_id, "type": "readings", **delta})
+                    cursor = delta["cursor"]
+
+                    # Any number of commits since the last delta are covered
+                    # by the next one
+                    while subscription.get(SUBSCRIPTION_POLL_INTERVAL) is None:
+                        if stopped.is_set():
+                            return
+            except Exception as e:
+                # Most likely the client went away mid-send
+                print(e)
+            finally:
+                self.broadcaster.unsubscribe(subscription)
+
+        threading.Thread(target=run, name="channel-subscription", daemon=True).start()
+
+    def _cancel(self, request_id: Any, notify: bool = True) -> None:
+        with self._lock:
+            cancelled = self._queries.pop(request_id, None)
+            subscription = self._subscriptions.pop(request_id, None)
+
+        if cancelled is not None:
+            # Makes SQLite's progress handler abort the running statement
+            cancelled.set()
+        if subscription is not None:
+            # Wake the subscription so it notices straight away
+            subscription[1].set()
+            subscription[0].put(None)
+        if notify and (cancelled is not None or subscription is not None):
+            self.send({"id": request_id, "type": "cancelled"})
@@ -0,0 +1,93 @@
+import io
+import zlib
+from typing import BinaryIO, List, Optional
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Size of the compressed chunks read from the underlying stream
+READ_CHUNK_SIZE = 64 * 1024
+
+
+class UnsupportedEncoding(ValueError):
+    """The request body uses a Content-Encoding we can't decode."""
+
+
+def supported_encodings() -> List[str]:
+    """Get the Content-Encodings that request bodies may use."""
+    encodings = ["gzip", "deflate"]
+    if zstandard is not None:
+        encodings.append("zstd")
+    return encodings
+
+
+class _ZlibReader(io.RawIOBase):
+    """Readable stream that inflates a gzip or deflate stream as it is read."""
+
+    def __init__(self, stream: BinaryIO, encoding: str):
+        self._stream = stream
+        # gzip, or deflate with a zlib header; switched to raw deflate below if
+        # the client sent deflate without a header
+        wbits = 16 + zlib.MAX_WBITS if encoding == "gzip" else zlib.MAX_WBITS
+        self._decompressor = zlib.decompressobj(wbits)
+        self._raw_fallback = encoding == "deflate"
+        self._pending = b""
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        size = len(buffer)
+        while True:
+            if self._pending:
+                data = self._decompressor.decompress(self._pending, size)
+                self._pending = self._decompressor.unconsumed_tail
+            elif self._decompressor.eof:
+                return 0
+            else:
+                chunk = self._stream.read(READ_CHUNK_SIZE)
+                if not chunk:
+                    data = self._decompressor.flush()
+                    if not data:
+                        return 0
+                else:
+                    try:
+                        data = self._decompressor.decompress(chunk, size)
+                    except zlib.error:
+                        if not self._raw_fallback:
+                            raise
+                        self._decompressor = zlib.decompressobj(-zlib.MAX_WBITS)
+                        data = self._decompressor.decompress(chunk, size)
+                    self._pending = self._decompressor.unconsumed_tail
+                self._raw_fallback = False
+            if data:
+                buffer[: len(data)] = data
+                return len(data)
+
+
+def decompressing_reader(stream: BinaryIO, encoding: Optional[str]) -> BinaryIO:
+    """
+    Wrap a request body stream so that reading it yields the decoded body.
+
+    Decompression happens incrementally as the body is read, so the whole
+    compressed or decompressed body is never held in memory at once.
+
+    Args:
+        stream: The raw request body
+        encoding: The request's Content-Encoding header, if any
+
+    Raises:
+        UnsupportedEncoding: If the encoding isn't one we can decode
+    """
+    encoding = (encoding or "identity").strip().lower()
+    if encoding == "identity":
+        return stream
+    if encoding in ("gzip", "x-gzip"):
+        return io.BufferedReader(_ZlibReader(stream, "gzip"))
+    if encoding == "deflate":
+        return io.BufferedReader(_ZlibReader(stream, "deflate"))
+    if encoding == "zstd" and zstandard is not None:
+        return io.BufferedReader(zstandard.ZstdDecompressor().stream_reader(stream))
+    raise UnsupportedEncoding(f"Unsupported Content-Encoding: {encoding}")
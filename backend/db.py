@@ -0,0 +1,188 @@
+import queue
+import sqlite3
+import threading
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Sequence
+
+FLIGHT_DB_PATH = "flight_data.db"
+QUERY_DB_PATH = "anon_data.db"
+
+# Page cache size per connection in KiB (negative values are KiB in SQLite)
+CACHE_SIZE_KIB = 16 * 1024
+# Size of the memory-mapped region used for reads, in bytes
+MMAP_SIZE = 256 * 1024 * 1024
+# Number of prepared statements cached per connection
+STATEMENT_CACHE_SIZE = 256
+# How many idle read connections to keep around per database
+MAX_IDLE_READERS = 8
+# Maximum number of values looked up per IN (...) query (SQLite limits the
+# number of bound parameters)
+LOOKUP_CHUNK_SIZE = 500
+
+
+class Database:
+    """
+    Long-lived connections to a single SQLite database.
+
+    The database is opened in WAL mode so that dashboards reading the data
+    never block the recorder writing it. Reads check a connection out of a
+    pool for the duration of a request; writes go through one shared writer
+    connection guarded by a lock, since SQLite only allows one writer anyway.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._readers: "queue.LifoQueue[sqlite3.Connection]" = queue.LifoQueue(
+            maxsize=MAX_IDLE_READERS
+        )
+        self._writer = None
+        self._write_lock = threading.Lock()
+        self._commit_listeners: List[Callable[[], None]] = []
+        self._locked_commit_listeners: List[Callable[[], None]] = []
+        self._rollback_listeners: List[Callable[[], None]] = []
+        # Objects that live as long as this database's connections, like
+        # in-memory state derived from its contents
+        self.extensions: Dict[str, Any] = {}
+
+    def _connect(self) -> sqlite3.Connection:
+        # Connections are handed between request threads, but only ever used
+        # by one thread at a time
+        conn = sqlite3.connect(
+            self.path,
+            check_same_thread=False,
+            cached_statements=STATEMENT_CACHE_SIZE,
+        )
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(f"PRAGMA cache_size=-{CACHE_SIZE_KIB}")
+        conn.execute(f"PRAGMA mmap_size={MMAP_SIZE}")
+        conn.execute("PRAGMA busy_timeout=5000")
+        return conn
+
+    @contextmanager
+    def reader(self) -> Iterator[sqlite3.Connection]:
+        """Check out a read connection for the duration of the block."""
+        try:
+            conn = self._readers.get_nowait()
+        except queue.Empty:
+            conn = self._connect()
+
+        try:
+            yield conn
+        finally:
+            # Never hand a connection with an open transaction to the next request
+            if conn.in_transaction:
+                conn.rollback()
+            try:
+                self._readers.put_nowait(conn)
+            except queue.Full:
+                conn.close()
+
+    @contextmanager
+    def writer(self) -> Iterator[sqlite3.Connection]:
+        """
+        Hold the writer connection for the duration of the block.
+
+        The block runs as one transaction: it is committed if the block
+        succeeds and rolled back if it raises.
+        """
+        with self._write_lock:
+            if self._writer is None:
+                self._writer = self._connect()
+            try:
+                yield self._writer
+                self._writer.commit()
+            except BaseException:
+                self._writer.rollback()
+                for listener in self._rollback_listeners:
+                    listener()
+                raise
+            for listener in self._locked_commit_listeners:
+                listener()
+
+        # Outside the lock, so listeners never hold up the next write
+        for listener in self._commit_listeners:
+            listener()
+
+    def add_commit_listener(
+        self, listener: Callable[[], None], locked: bool = False
+    ) -> None:
+        """
+        Call a function after every successful writer transaction.
+
+        Listeners run on the writing thread once the commit is visible to
+        readers, so they should be quick and must not raise.
+
+        Args:
+            listener: Function to call
+            locked: Whether to call it still holding the write lock, before
+                    the next transaction can start, e.g. to settle in-memory
+                    state the transaction changed
+        """
+        if locked:
+            self._locked_commit_listeners.append(listener)
+        else:
+            self._commit_listeners.append(listener)
+
+    def add_rollback_listener(self, listener: Callable[[], None]) -> None:
+        """
+        Call a function after a writer transaction is rolled back, e.g. to
+        discard in-memory state that assumed it would commit.
+
+        Listeners run on the writing thread, still holding the write lock.
+        """
+        self._rollback_listeners.append(listener)
+
+    def close(self) -> None:
+        """Close every connection currently held by this database."""
+        with self._write_lock:
+            if self._writer is not None:
+                self._writer.close()
+                self._writer = None
+        while True:
+            try:
+                self._readers.get_nowait().close()
+            except queue.Empty:
+                break
+
+
+def chunked_lookup(
+    conn: sqlite3.Connection, query: str, values: Sequence[Any]
+) -> Iterator[sqlite3.Row]:
+    """
+    Run a query for any number of values, LOOKUP_CHUNK_SIZE at a time.
+
+    Args:
+        conn: Connection to query
+        query: SQL with an IN ({placeholders}) clause, filled in with one
+               placeholder per value of each chunk
+        values: Values to look up
+
+    Returns:
+        Iterator over the rows of every chunk's query
+    """
+    for i in range(0, len(values), LOOKUP_CHUNK_SIZE):
+        chunk = values[i : i + LOOKUP_CHUNK_SIZE]
+        placeholders = ",".join("?" for _ in chunk)
+        yield from conn.execute(query.format(placeholders=placeholders), chunk)
+
+
+_databases: Dict[str, Database] = {}
+_databases_lock = threading.Lock()
+
+
+def get_database(path: str) -> Database:
+    """Get the shared Database for a path, opening it on first use."""
+    with _databases_lock:
+        if path not in _databases:
+            _databases[path] = Database(path)
+        return _databases[path]
+
+
+def close_all() -> None:
+    """Close every shared Database."""
+    with _databases_lock:
+        for database in _databases.values():
+            database.close()
+        _databases.clear()
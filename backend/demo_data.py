@@ -5,46 +5,14 @@ import sqlite3
 from datetime import datetime, timedelta
 from typing import Dict, List
 
+from parsers import epoch_ms
+from schema import setup_readings
+
 
 def setup_database(db_path):
     """Set up the SQLite database with the required schema."""
     conn = sqlite3.connect(db_path)
-    c = conn.cursor()
-
-    # Create readings table with all required fields
-    c.execute("""CREATE TABLE IF NOT EXISTS readings
-                (id INTEGER PRIMARY KEY AUTOINCREMENT,
-                 timestamp TEXT NOT NULL,
-                 latitude REAL,
-                 longitude REAL,
-                 altitude REAL,
-                 estimated_arrival_time TEXT,
-                 ground_speed REAL,
-                 outside_air_temperature REAL,
-                 true_heading REAL,
-                 wind_direction REAL,
-                 wind_speed REAL,
-                 distance_to_destination REAL,
-                 distance_from_origin REAL,
-                 distance_traveled REAL,
-                 weight_on_wheels TEXT,
-                 time_to_destination_minutes INTEGER,
-                 total_flight_time_minutes INTEGER,
-                 scheduled_departure_time TEXT,
-                 decompression TEXT,
-                 all_doors_closed TEXT,
-                 departure_airport TEXT,
-                 destination_airport TEXT,
-                 flight_number TEXT,
-                 aircraft_type TEXT,
-                 raw_data JSON,
-                 UNIQUE(timestamp))""")
-
-    # Create indexes
-    c.execute(
-        "CREATE INDEX IF NOT EXISTS idx_readings_timestamp ON readings(timestamp)"
-    )
-
+    setup_readings(conn)
     conn.commit()
     conn.close()
 
@@ -181,7 +149,7 @@ def write_demo_data_to_db(
             c.execute(
                 """
                 INSERT INTO readings (
-                    timestamp, latitude, longitude, altitude,
+                    timestamp, timestamp_ms, latitude, longitude, altitude,
                     estimated_arrival_time, ground_speed, outside_air_temperature,
                     true_heading, wind_direction, wind_speed, distance_to_destination,
                     distance_from_origin, distance_traveled, weight_on_wheels,
@@ -189,10 +157,11 @@ def write_demo_data_to_db(
                     scheduled_departure_time, decompression,
                     all_doors_closed, departure_airport, destination_airport,
                     flight_number, aircraft_type, raw_data
-                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
             """,
                 (
                     point["timestamp"],
+                    epoch_ms(point["timestamp"]),
                     point["latitude"],
                     point["longitude"],
                     point["altitude"],
@@ -0,0 +1,270 @@
+import atexit
+import hashlib
+import json
+import queue
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+# Default maximum number of readings waiting to be written
+DEFAULT_QUEUE_SIZE = 10000
+# Default maximum number of readings committed in one transaction
+DEFAULT_BATCH_SIZE = 500
+# Default time to wait for more readings before committing a group, in seconds
+DEFAULT_WINDOW = 0.05
+
+# Default number of recent payload hashes remembered per source
+DEFAULT_DEDUP_SIZE = 64
+# Maximum number of sources tracked by the deduplicator
+MAX_DEDUP_SOURCES = 64
+
+_STOP = object()
+
+
+class IngestQueue:
+    """
+    Bounded write-behind queue for parsed readings.
+
+    Request threads enqueue readings and return immediately. A single
+    background thread drains the queue and commits readings in groups, either
+    when a group reaches `batch_size` readings or `window` seconds after its
+    first reading arrived, whichever comes first.
+    """
+
+    def __init__(
+        self,
+        write_batch: Callable[[List[Dict[str, Any]]], List[str]],
+        max_size: int = DEFAULT_QUEUE_SIZE,
+        batch_size: int = DEFAULT_BATCH_SIZE,
+        window: float = DEFAULT_WINDOW,
+    ):
+        """
+        Args:
+            write_batch: Function that writes a list of readings in one
+                         transaction and returns a status for each
+            max_size: Maximum number of readings waiting to be written
+            batch_size: Maximum number of readings committed in one transaction
+            window: Time to wait for more readings before committing, in seconds
+        """
+        self.write_batch = write_batch
+        self.max_size = max_size
+        self.batch_size = batch_size
+        self.window = window
+
+        self._queue: "queue.Queue[Any]" = queue.Queue(maxsize=max_size)
+        self._thread = None
+        self._stats_lock = threading.Lock()
+        self._stats = {
+            "enqueued": 0,
+            "rejected": 0,
+            "recorded": 0,
+            "duplicates": 0,
+            "failed": 0,
+            "commits": 0,
+            "commit_seconds_total": 0.0,
+            "commit_seconds_last": 0.0,
+            "commit_seconds_max": 0.0,
+        }
+
+    def start(self) -> None:
+        """Start the background writer thread."""
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(
+            target=self._run, name="ingest-writer", daemon=True
+        )
+        self._thread.start()
+        atexit.register(self.stop)
+
+    def put(
+        self,
+        parsed_data: Dict[str, Any],
+        on_recorded: Optional[Callable[[], None]] = None,
+    ) -> None:
+        """
+        Enqueue a parsed reading to be written.
+
+        Args:
+            parsed_data: Dictionary containing formatted flight data
+            on_recorded: Called once the reading has been committed, or found
+                         to be a duplicate of one that has
+
+        Raises:
+            queue.Full: If the queue is at capacity
+        """
+        try:
+            self._queue.put_nowait((parsed_data, on_recorded))
+        except queue.Full:
+            with self._stats_lock:
+                self._stats["rejected"] += 1
+            raise
+        with self._stats_lock:
+            self._stats["enqueued"] += 1
+
+    def stop(self) -> None:
+        """Write every queued reading, then stop the background writer thread."""
+        if self._thread is None:
+            return
+        # Blocks if the queue is full, so the sentinel is always behind the
+        # last acknowledged reading
+        self._queue.put(_STOP)
+        self._thread.join()
+        self._thread = None
+
+    def stats(self) -> Dict[str, Any]:
+        """Get the current queue depth and commit statistics."""
+        with self._stats_lock:
+            stats = dict(self._stats)
+        commits = stats["commits"]
+        stats["depth"] = self._queue.qsize()
+        stats["max_size"] = self.max_size
+        stats["commit_ms_avg"] = (
+            round(stats.pop("commit_seconds_total") / commits * 1000, 3)
+            if commits
+            else 0.0
+        )
+        stats["commit_ms_last"] = round(stats.pop("commit_seconds_last") * 1000, 3)
+        stats["commit_ms_max"] = round(stats.pop("commit_seconds_max") * 1000, 3)
+        return stats
+
+    def _run(self) -> None:
+        stopping = False
+        while not stopping:
+            item = self._queue.get()
+            if item is _STOP:
+                break
+
+            # Gather more readings until the group is full or the window closes
+            batch = [item]
+            deadline = time.monotonic() + self.window
+            while len(batch) < self.batch_size:
+                timeout = deadline - time.monotonic()
+                try:
+                    item = (
+                        self._queue.get(timeout=timeout)
+                        if timeout > 0
+                        else self._queue.get_nowait()
+                    )
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    stopping = True
+                    break
+                batch.append(item)
+
+            self._commit(batch)
+
+    def _commit(
+        self, batch: List[Tuple[Dict[str, Any], Optional[Callable[[], None]]]]
+    ) -> None:
+        start = time.perf_counter()
+        try:
+            statuses = self.write_batch([parsed_data for parsed_data, _ in batch])
+        except Exception as e:
+            print(e)
+            if len(batch) > 1:
+                # Retry each half, so a reading that can't be written only
+                # takes itself down with it
+                half = len(batch) // 2
+                self._commit(batch[:half])
+                self._commit(batch[half:])
+            else:
+                with self._stats_lock:
+                    self._stats["failed"] += 1
+            return
+        elapsed = time.perf_counter() - start
+
+        duplicates = statuses.count("duplicate")
+        errors = statuses.count("error")
+        with self._stats_lock:
+            self._stats["recorded"] += len(batch) - duplicates - errors
+            self._stats["duplicates"] += duplicates
+            self._stats["failed"] += errors
+            self._stats["commits"] += 1
+            self._stats["commit_seconds_total"] += elapsed
+            self._stats["commit_seconds_last"] = elapsed
+            self._stats["commit_seconds_max"] = max(
+                self._stats["commit_seconds_max"], elapsed
+            )
+
+        for (_, on_recorded), status in zip(batch, statuses):
+            if on_recorded is not None and status != "error":
+                on_recorded()
+
+
+def dedup_payload(content: Dict[str, Any]) -> bytes:
+    """
+    Get the bytes that identify a recorder payload.
+
+    This is the raw captured page ("raw" from the Firefox recorder) when there
+    is one, since the recorder stamps every copy of the same page with a new
+    capture time. Otherwise it is the whole content.
+    """
+    raw = content.get("raw")
+    if isinstance(raw, str):
+        return raw.encode("utf-8")
+    if raw is None:
+        raw = content
+    return json.dumps(raw, sort_keys=True, default=str).encode("utf-8")
+
+
+class PayloadDeduplicator:
+    """
+    Remembers hashes of recently recorded payloads, per source, so that exact
+    repeats can be skipped before they are parsed or hit the database.
+    """
+
+    def __init__(self, size: int = DEFAULT_DEDUP_SIZE):
+        """
+        Args:
+            size: Number of recent payload hashes remembered per source
+        """
+        self.size = size
+        self._recent: "OrderedDict[str, OrderedDict[bytes, None]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+
+    def check(self, source: str, payload: bytes) -> Optional[bytes]:
+        """
+        Check whether a payload was recently recorded from a source.
+
+        Returns:
+            None if the payload is a repeat, otherwise its digest to pass to
+            `remember` once it has been recorded
+        """
+        digest = hashlib.blake2b(payload, digest_size=16).digest()
+        with self._lock:
+            recent = self._recent.get(source)
+            if recent is not None and digest in recent:
+                recent.move_to_end(digest)
+                self._hits += 1
+                return None
+            self._misses += 1
+        return digest
+
+    def remember(self, source: str, digest: bytes) -> None:
+        """Remember that a payload from a source was recorded."""
+        with self._lock:
+            recent = self._recent.get(source)
+            if recent is None:
+                recent = self._recent[source] = OrderedDict()
+                if len(self._recent) > MAX_DEDUP_SOURCES:
+                    self._recent.popitem(last=False)
+            else:
+                self._recent.move_to_end(source)
+            recent[digest] = None
+            recent.move_to_end(digest)
+            if len(recent) > self.size:
+                recent.popitem(last=False)
+
+    def stats(self) -> Dict[str, Any]:
+        """Get the number of repeats skipped and the hit rate."""
+        with self._lock:
+            checked = self._hits + self._misses
+            return {
+                "hits": self._hits,
+                "misses": self._misses,
+                "hit_rate": round(self._hits / checked, 4) if checked else 0.0,
+            }
@@ -0,0 +1,251 @@
+import json
+import math
+import re
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Union
+
+Extractor = Callable[[Dict[str, Any]], Dict[str, Any]]
+
+
+class Field(NamedTuple):
+    """
+    How to fill one readings column from a recorded content object.
+
+    Attributes:
+        target: Column in the readings table
+        source: Dotted path to the value in the content (e.g. "raw.latitude").
+                Stepping into a value that is a JSON string decodes it first,
+                so captured page text can be addressed directly.
+        coerce: Optional type conversion applied to non-null values
+        scale: Optional multiplier applied after coercion, for unit conversion
+        default: Value used when the source is missing or null
+    """
+
+    target: str
+    source: str
+    coerce: Optional[Callable[[Any], Any]] = None
+    scale: Optional[float] = None
+    default: Any = None
+
+
+def json_text(value: Any) -> str:
+    """Store objects as JSON text and leave strings as they are."""
+    if isinstance(value, str):
+        return value
+    return json.dumps(value)
+
+
+def flag(value: Any) -> str:
+    """Store booleans the way the frontend expects them, as "1" or "0"."""
+    if isinstance(value, str):
+        return "1" if value.lower() in ("1", "true", "yes") else "0"
+    return "1" if value else "0"
+
+
+def heading(value: Any) -> float:
+    """Normalize a heading in degrees to [0, 360)."""
+    return float(value) % 360
+
+
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+_MILLISECOND = timedelta(milliseconds=1)
+
+
+def epoch_ms(value: Any) -> int:
+    """
+    Normalize a timestamp to integer milliseconds since the Unix epoch.
+
+    Recorders send Date.now() milliseconds, as a number or as digits, and the
+    demo data sends ISO 8601 text. ISO timestamps without a UTC offset are
+    taken as local time, the way the frontend has always read them.
+
+    Raises:
+        ValueError: If the value isn't a timestamp in either format
+    """
+    if isinstance(value, str):
+        if value.isdigit():
+            return int(value)
+        try:
+            time = datetime.fromisoformat(value)
+        except ValueError:
+            try:
+                value = float(value)
+            except ValueError:
+                raise ValueError(f"Not a timestamp: {value!r}") from None
+        else:
+            if time.tzinfo is None:
+                # Much faster than astimezone(), and exact for whole seconds
+                seconds = int(time.replace(microsecond=0).timestamp())
+                return seconds * 1000 + time.microsecond // 1000
+            return (time - _EPOCH) // _MILLISECOND
+    if (
+        isinstance(value, (int, float))
+        and not isinstance(value, bool)
+        and math.isfinite(value)
+    ):
+        return round(value)
+    raise ValueError(f"Not a timestamp: {value!r}")
+
+
+def _decode(value: Any) -> Dict[str, Any]:
+    """Get the object to step into when following a source path."""
+    if isinstance(value, str):
+        try:
+            value = json.loads(value)
+        except ValueError:
+            return {}
+    return value if isinstance(value, dict) else {}
+
+
+def compile_fields(name: str, fields: List[Field]) -> Extractor:
+    """
+    Compile a field mapping into a single specialized extractor function.
+
+    The mapping is turned into straight-line Python source, with one lookup
+    per path segment and each intermediate object decoded once, so no
+    per-record work is spent interpreting the mapping.
+
+    Args:
+        name: Name of the airline, used to name the generated function
+        fields: Mapping from content paths to readings columns
+
+    Returns:
+        Function that takes a content object and returns the readings row
+    """
+    function_name = "parse_" + re.sub(r"\W", "_", name.lower())
+    namespace: Dict[str, Any] = {"_decode": _decode}
+    lines = [f"def {function_name}(content):"]
+    objects = {"": "content"}
+
+    def object_for(path: str) -> str:
+        # Variable holding the decoded object at a path prefix
+        if path not in objects:
+            parent, _, key = path.rpartition(".")
+            var = f"_obj{len(objects)}"
+            lines.append(f"    {var} = _decode({object_for(parent)}.get({key!r}))")
+            objects[path] = var
+        return objects[path]
+
+    row = []
+    for i, field in enumerate(fields):
+        parent, _, key = field.source.rpartition(".")
+        var = f"_v{i}"
+        lines.append(f"    {var} = {object_for(parent)}.get({key!r})")
+
+        if field.coerce is not None or field.scale is not None:
+            value = var
+            if field.coerce is not None:
+                namespace[f"_coerce{i}"] = field.coerce
+                value = f"_coerce{i}({value})"
+            if field.scale is not None:
+                value = f"{value} * {field.scale!r}"
+            lines.append(f"    if {var} is not None:")
+            lines.append(f"        {var} = {value}")
+
+        if field.default is not None:
+            namespace[f"_default{i}"] = field.default
+            lines.append(f"    if {var} is None:")
+            lines.append(f"        {var} = _default{i}")
+
+        row.append(f"        {field.target!r}: {var},")
+
+    lines.append("    return {")
+    lines.extend(row)
+    lines.append("    }")
+
+    exec(compile("\n".join(lines), f"<parser {name}>", "exec"), namespace)
+    return namespace[function_name]
+
+
+# Fields sent by the demo data and by recorders that already post content in
+# the readings format
+DEFAULT_FIELDS = [
+    Field("timestamp", "timestamp"),
+    Field("departure_airport", "departure_airport"),
+    Field("destination_airport", "destination_airport"),
+    Field("flight_number", "flight_number"),
+    Field("aircraft_type", "aircraft_type"),
+    Field("latitude", "latitude"),
+    Field("longitude", "longitude"),
+    Field("altitude", "altitude"),
+    Field("estimated_arrival_time", "estimated_arrival_time"),
+    Field("scheduled_departure_time", "scheduled_departure_time"),
+    Field("time_to_destination_minutes", "time_to_destination_minutes"),
+    Field("total_flight_time_minutes", "total_flight_time_minutes"),
+    Field("distance_to_destination", "distance_to_destination"),
+    Field("distance_from_origin", "distance_from_origin"),
+    Field("distance_traveled", "distance_traveled"),
+    Field("wind_speed", "wind_speed"),
+    Field("wind_direction", "wind_direction"),
+    Field("ground_speed", "ground_speed"),
+    Field("outside_air_temperature", "outside_air_temperature"),
+    Field("true_heading", "true_heading"),
+    Field("weight_on_wheels", "weight_on_wheels", default=False),
+    Field("decompression", "decompression", default=False),
+    Field("all_doors_closed", "all_doors_closed", default=True),
+    Field("raw_data", "raw_data", coerce=json_text, default="{}"),
+]
+
+# British Airways in-flight portal, as captured by the Firefox recorder: the
+# portal's camelCase JSON is in "raw" and the capture time in "timestamp"
+# (see frontend/src/app/data/example_ba.json)
+BA_FIELDS = [
+    Field("timestamp", "timestamp"),
+    Field("departure_airport", "raw.originIATA"),
+    Field("destination_airport", "raw.destinationIATA"),
+    Field("flight_number", "raw.flightNumber"),
+    Field("aircraft_type", "raw.aircraftType"),
+    Field("latitude", "raw.latitude", coerce=float),
+    Field("longitude", "raw.longitude", coerce=float),
+    Field("altitude", "raw.altitude", coerce=float),
+    Field("estimated_arrival_time", "raw.estimatedArrivalTime"),
+    Field("scheduled_departure_time", "raw.scheduledDepartureTime"),
+    Field("time_to_destination_minutes", "raw.timeToDestinationMinutes", coerce=int),
+    Field("total_flight_time_minutes", "raw.totalFlightTimeMinutes", coerce=int),
+    Field("distance_to_destination", "raw.distanceToDestination", coerce=float),
+    Field("wind_speed", "raw.windSpeed", coerce=float),
+    Field("wind_direction", "raw.windDirection", coerce=float),
+    Field("ground_speed", "raw.groundSpeed", coerce=float),
+    Field("outside_air_temperature", "raw.outsideAirTemperature", coerce=float),
+    Field("true_heading", "raw.trueHeading", coerce=heading),
+    Field("weight_on_wheels", "raw.weightOnWheels", coerce=flag, default=False),
+    Field("decompression", "raw.decompression", coerce=flag, default=False),
+    Field("all_doors_closed", "raw.allDoorsClosed", coerce=flag, default=True),
+    Field("raw_data", "raw", coerce=json_text, default="{}"),
+]
+
+DEFAULT_AIRLINE = "DEFAULT"
+
+_PARSERS: Dict[str, Extractor] = {}
+
+
+def register_parser(airline: str, parser: Union[List[Field], Extractor]) -> None:
+    """
+    Register the parser used for an airline's recorded content.
+
+    Args:
+        airline: Airline name, as passed to `app.py --airline`
+        parser: Either a field mapping, which is compiled now, or a
+                hand-written function from content to readings row
+    """
+    if not callable(parser):
+        parser = compile_fields(airline, parser)
+    _PARSERS[airline.upper()] = parser
+
+
+def get_parser(airline: Optional[str]) -> Extractor:
+    """Get the parser for an airline, falling back to the default parser."""
+    if airline:
+        parser = _PARSERS.get(airline.upper())
+        if parser is not None:
+            return parser
+    return _PARSERS[DEFAULT_AIRLINE]
+
+
+def registered_airlines() -> List[str]:
+    """Get the names of every airline with a registered parser."""
+    return sorted(_PARSERS)
+
+
+register_parser(DEFAULT_AIRLINE, DEFAULT_FIELDS)
+register_parser("BA", BA_FIELDS)
@@ -0,0 +1,582 @@
+import argparse
+import bisect
+import math
+import sqlite3
+import threading
+from typing import List, Optional, Sequence, Tuple
+
+from db import Database
+from schema import setup_timestamps
+
+# SQL for a reading's position in readings r LEFT JOIN positions p: the one
+# dead-reckoned at ingest, or what was recorded if there isn't one yet
+LATITUDE_SQL = "CASE WHEN p.position_source IS NULL THEN r.latitude ELSE p.latitude END"
+LONGITUDE_SQL = (
+    "CASE WHEN p.position_source IS NULL THEN r.longitude ELSE p.longitude END"
+)
+
+MILLISECONDS_PER_HOUR = 3_600_000
+
+# Common airport coordinates
+# Format: (latitude, longitude)
+AIRPORT_COORDINATES = {
+    "JFK": (40.6413, -73.7781),  # New York JFK
+    "LHR": (51.4700, -0.4543),  # London Heathrow
+    "SFO": (37.6213, -122.3790),  # San Francisco
+    "LAX": (33.9416, -118.4085),  # Los Angeles
+    "ORD": (41.9742, -87.9073),  # Chicago O'Hare
+    "DFW": (32.8998, -97.0403),  # Dallas/Fort Worth
+    "ATL": (33.6407, -84.4277),  # Atlanta
+    "MIA": (25.7959, -80.2870),  # Miami
+    "SEA": (47.4502, -122.3088),  # Seattle
+    "BOS": (42.3656, -71.0096),  # Boston
+    "IAD": (38.9445, -77.4558),  # Washington Dulles
+    "DEN": (39.8561, -104.6737),  # Denver
+    "LAS": (36.0840, -115.1537),  # Las Vegas
+    "PHX": (33.4374, -112.0078),  # Phoenix
+    "EWR": (40.6895, -74.1745),  # Newark
+    "IAH": (29.9902, -95.3368),  # Houston
+    "MCO": (28.4294, -81.3089),  # Orlando
+    "YYZ": (43.6777, -79.6248),  # Toronto
+    "CDG": (49.0097, 2.5479),  # Paris Charles de Gaulle
+    "AMS": (52.3105, 4.7683),  # Amsterdam
+    "FRA": (50.0379, 8.5622),  # Frankfurt
+    "DXB": (25.2532, 55.3657),  # Dubai
+    "SIN": (1.3644, 103.9915),  # Singapore
+    "HKG": (22.3080, 113.9185),  # Hong Kong
+    "NRT": (35.7720, 140.3929),  # Tokyo Narita
+    "PEK": (40.0799, 116.6031),  # Beijing
+    "SYD": (-33.9461, 151.1772),  # Sydney
+    "FCO": (41.8003, 12.2389),
+    # Add more airports as needed
+}
+
+
+def get_airport_coordinates(airport_code: str) -> Optional[Tuple[float, float]]:
+    """
+    Get the coordinates for a given airport code.
+
+    Args:
+        airport_code: IATA airport code (e.g., 'JFK', 'SFO')
+
+    Returns:
+        Tuple of (latitude, longitude) if found, None if not found
+    """
+    return AIRPORT_COORDINATES.get(airport_code.upper())
+
+
+def calculate_new_position(
+    start_lat: float,
+    start_lon: float,
+    heading: float,
+    speed: float,  # ground speed in knots
+    elapsed_time: float,  # time in hours
+) -> Tuple[float, float]:
+    """
+    Calculate new position based on initial position, heading, speed and time elapsed.
+    Uses great circle navigation formulas for accuracy over longer distances.
+
+    Args:
+        start_lat: Starting latitude in degrees
+        start_lon: Starting longitude in degrees
+        heading: True heading in degrees
+        speed: Ground speed in knots
+        elapsed_time: Time elapsed in hours
+
+    Returns:
+        Tuple of (new_latitude, new_longitude) in degrees
+    """
+    # Convert inputs to radians
+    lat1 = math.radians(start_lat)
+    lon1 = math.radians(start_lon)
+    heading_rad = math.radians(heading)
+
+    # Calculate distance traveled in nautical miles
+    distance = speed * elapsed_time
+
+    # Convert distance to angular distance in radians
+    # 60 nautical miles = 1 degree of great circle arc
+    angular_distance = math.radians(distance / 60.0)
+
+    # Calculate new position using great circle navigation formulas
+    lat2 = math.asin(
+        math.sin(lat1) * math.cos(angular_distance)
+        + math.cos(lat1) * math.sin(angular_distance) * math.cos(heading_rad)
+    )
+
+    lon2 = lon1 + math.atan2(
+        math.sin(heading_rad) * math.sin(angular_distance) * math.cos(lat1),
+        math.cos(angular_distance) - math.sin(lat1) * math.sin(lat2),
+    )
+
+    # Convert back to degrees
+    return (math.degrees(lat2), math.degrees(lon2))
+
+
+def dead_reckon_gap(
+    start_lat: float,
+    start_lon: float,
+    headings: Sequence[float],
+    speeds: Sequence[float],
+    elapsed_times: Sequence[float],
+) -> List[Tuple[float, float]]:
+    """
+    Dead-reckon the positions of consecutive readings without a fix, each one
+    from the position of the reading before it.
+
+    Gives the same positions as calling calculate_new_position for each
+    reading and rounding to 4 decimal places, but with the call overhead and
+    everything repeated for every reading taken out of the loop.
+
+    Args:
+        start_lat: Latitude of the reading before the gap in degrees
+        start_lon: Longitude of the reading before the gap in degrees
+        headings: True heading of each reading in degrees
+        speeds: Ground speed of each reading in knots
+        elapsed_times: Hours since the reading before each one
+
+    Returns:
+        Rounded (latitude, longitude) of each reading in degrees, stopping
+        early if a position can't be calculated
+    """
+    sin, cos, asin, atan2 = math.sin, math.cos, math.asin, math.atan2
+    # What math.radians and math.degrees multiply by
+    to_radians, to_degrees = math.pi / 180, 180 / math.pi
+
+    positions = []
+    lat, lon = start_lat, start_lon
+    for heading, speed, elapsed_time in zip(headings, speeds, elapsed_times):
+        try:
+            heading_rad = math.radians(heading)
+            angular_distance = math.radians(speed * elapsed_time / 60.0)
+            cos_distance, sin_distance = cos(angular_distance), sin(angular_distance)
+            lat1 = lat * to_radians
+            sin_lat1, cos_lat1 = sin(lat1), cos(lat1)
+            # Also the sine of the new latitude
+            sin_lat2 = sin_lat1 * cos_distance + cos_lat1 * sin_distance * cos(
+                heading_rad
+            )
+            lat2 = asin(sin_lat2)
+        except (ValueError, TypeError):
+            break
+        lon2 = lon * to_radians + atan2(
+            sin(heading_rad) * sin_distance * cos_lat1,
+            cos_distance - sin_lat1 * sin_lat2,
+        )
+        lat, lon = round(lat2 * to_degrees, 4), round(lon2 * to_degrees, 4)
+        positions.append((lat, lon))
+    return positions
+
+
+# Position of one reading after interpolation:
+# (latitude, longitude, position_interpolated, position_source)
+Position = Tuple[Optional[float], Optional[float], bool, str]
+
+
+class _TrackPoint:
+    """What interpolation needs to know about one cruise reading."""
+
+    __slots__ = (
+        "id",
+        "time",
+        "key",
+        "latitude",
+        "longitude",
+        "ground_speed",
+        "true_heading",
+        "departure_airport",
+        "position",
+        "stored",
+    )
+
+    def __init__(self, row: sqlite3.Row):
+        self.id = row["id"]
+        self.time = row["timestamp_ms"]
+        # Readings are kept in time order, and in the order they were
+        # recorded if they're at the same time
+        self.key = (self.time, self.id)
+        self.latitude = row["latitude"]
+        self.longitude = row["longitude"]
+        self.ground_speed = row["ground_speed"]
+        self.true_heading = row["true_heading"]
+        self.departure_airport = row["departure_airport"]
+        self.position: Position = self.recorded_position()
+        # What the positions table currently holds for this reading
+        self.stored: Optional[Position] = None
+        if row["position_source"] is not None:
+            self.stored = (
+                row["position_latitude"],
+                row["position_longitude"],
+                bool(row["position_interpolated"]),
+                row["position_source"],
+            )
+
+    def has_fix(self) -> bool:
+        return self.latitude is not None and self.longitude is not None
+
+    def recorded_position(self) -> Position:
+        return (self.latitude, self.longitude, False, "actual")
+
+
+class InterpolationState:
+    """
+    Interpolated positions of every cruise reading, kept up to date
+    incrementally and written to the positions table.
+
+    Produces exactly what recomputing every position from scratch would,
+    but only works on what changed since it last looked at the database:
+    readings appended at the end of the flight are extended from
+    the last position in O(new), and a late reading landing in the middle
+    only recomputes the gap it falls in, up to the next actual fix. Only
+    positions that differ from what's stored are written.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        """Forget everything, so the next update starts from the database."""
+        with self._lock:
+            self._cursor = 0
+            self._points: List[_TrackPoint] = []
+            self._keys: List[Tuple[int, int]] = []
+            # Index of the reading interpolation starts from: the first
+            # actual fix, or the first reading if it's placed at the
+            # departure airport
+            self._anchor: Optional[int] = None
+            # Whether anything changed since the last commit
+            self._dirty = False
+
+    def committed(self) -> None:
+        """Keep what changed, now that the transaction it was in committed."""
+        with self._lock:
+            self._dirty = False
+
+    def rolled_back(self) -> None:
+        """
+        Forget everything if it changed in a transaction that was rolled back,
+        since it got ahead of what was committed. Otherwise there's no need
+        to read the whole flight again.
+        """
+        with self._lock:
+            dirty = self._dirty
+        if dirty:
+            self.reset()
+
+    def update(self, conn: sqlite3.Connection) -> int:
+        """
+        Interpolate positions for readings recorded since the last update,
+        and write every position that changed to the positions table.
+
+        Args:
+            conn: Connection to read and write with, inside the writer's
+                  transaction
+
+        Returns:
+            Number of positions written
+        """
+        with self._lock:
+            (max_id,) = conn.execute(
+                "SELECT COALESCE(MAX(id), 0) FROM readings"
+            ).fetchone()
+            if max_id < self._cursor:
+                # Readings were deleted, start over
+                self._cursor = 0
+                self._points = []
+                self._keys = []
+                self._anchor = None
+                self._dirty = True
+            if max_id == self._cursor:
+                return 0
+            self._dirty = True
+
+            rows = conn.execute(
+                """
+                SELECT r.id, r.timestamp_ms, r.departure_airport, r.latitude,
+                    r.longitude, r.ground_speed, r.true_heading,
+                    p.latitude AS position_latitude,
+                    p.longitude AS position_longitude,
+                    p.position_interpolated, p.position_source
+                FROM readings r
+                LEFT JOIN positions p ON p.reading_id = r.id
+                WHERE r.altitude > 10000 AND r.id > ? AND r.id <= ?
+                    AND r.timestamp_ms IS NOT NULL
+                ORDER BY r.timestamp_ms ASC, r.id ASC
+                """,
+                (self._cursor, max_id),
+            ).fetchall()
+            self._cursor = max_id
+            if not rows:
+                return 0
+
+            new_points = [_TrackPoint(row) for row in rows]
+            if not self._points or new_points[0].key > self._keys[-1]:
+                # The usual case: everything new is later than what we have
+                self._points.extend(new_points)
+                self._keys.extend(point.key for point in new_points)
+            else:
+                for point in new_points:
+                    i = bisect.bisect_left(self._keys, point.key)
+                    self._points.insert(i, point)
+                    self._keys.insert(i, point.key)
+
+            first = bisect.bisect_left(self._keys, new_points[0].key)
+            last = bisect.bisect_left(self._keys, new_points[-1].key)
+            start, stop = self._refresh(
+                first, last, any(point.has_fix() for point in new_points)
+            )
+            return self._write(conn, start, stop, max_id)
+
+    def _find_anchor(self) -> Optional[int]:
+        for i, point in enumerate(self._points):
+            if point.has_fix():
+                return i
+        departure_airport = self._points[0].departure_airport
+        if departure_airport and get_airport_coordinates(departure_airport):
+            return 0
+        return None
+
+    def _refresh(self, first: int, last: int, new_fix: bool) -> Tuple[int, int]:
+        """
+        Recompute positions after readings were inserted between the indexes
+        first and last (inclusive).
+
+        Returns:
+            Range of indexes (inclusive) whose positions may have changed
+        """
+        old_anchor = self._anchor
+        if (
+            old_anchor is not None
+            and first > old_anchor
+            and (self._points[old_anchor].has_fix() or not new_fix)
+        ):
+            # The new readings are after the anchor, and can't replace it:
+            # it's an actual fix, or it's the departure airport and none of
+            # them are fixes
+            return first, self._fill(first, last)
+
+        # Readings landed at or before the start of interpolation, which may
+        # have changed where it starts; redo everything up to there
+        self._anchor = self._find_anchor()
+        if self._anchor is None:
+            for point in self._points:
+                point.position = point.recorded_position()
+            return 0, len(self._points) - 1
+
+        end = self._anchor if old_anchor is None else max(old_anchor, self._anchor)
+        for point in self._points[: end + 1]:
+            point.position = point.recorded_position()
+        anchor = self._points[self._anchor]
+        if not anchor.has_fix():
+            coords = get_airport_coordinates(anchor.departure_airport)
+            anchor.position = (coords[0], coords[1], True, "airport_reference")
+        return 0, self._fill(self._anchor + 1, max(last, end))
+
+    def _fill(self, start: int, last: int) -> int:
+        """
+        Dead-reckon positions from index start onwards, stopping at the first
+        actual fix after index last, beyond which nothing changes.
+
+        Returns:
+            Index of the last reading recomputed
+        """
+        i = start
+        while i < len(self._points):
+            current = self._points[i]
+            if current.has_fix():
+                current.position = current.recorded_position()
+                if i > last:
+                    return i
+                i += 1
+            else:
+                end = i + 1
+                while end < len(self._points) and not self._points[end].has_fix():
+                    end += 1
+                self._fill_gap(i, end)
+                i = end
+        return len(self._points) - 1
+
+    def _fill_gap(self, start: int, end: int) -> None:
+        """Dead-reckon the readings without a fix from index start to end."""
+        # The chain breaks at the first reading that's missing what it
+        # needs, and every reading after that in the gap keeps what was
+        # recorded
+        gap = self._points[start:end]
+        previous = self._points[start - 1]
+        headings, speeds, elapsed_times = [], [], []
+        if previous.position[0] is not None and previous.position[1] is not None:
+            for point in gap:
+                if point.ground_speed is None or point.true_heading is None:
+                    break
+                headings.append(point.true_heading)
+                speeds.append(point.ground_speed)
+                elapsed_times.append(
+                    (point.time - previous.time) / MILLISECONDS_PER_HOUR
+                )
+                previous = point
+
+        positions = []
+        if headings:
+            lat, lon = self._points[start - 1].position[:2]
+            positions = dead_reckon_gap(lat, lon, headings, speeds, elapsed_times)
+        for point, (lat, lon) in zip(gap, positions):
+            point.position = (lat, lon, True, "interpolated")
+        for point in gap[len(positions) :]:
+            point.position = point.recorded_position()
+
+    def _write(self, conn: sqlite3.Connection, start: int, stop: int, version: int):
+        changed = [
+            point
+            for point in self._points[start : stop + 1]
+            if point.position != point.stored
+        ]
+        conn.executemany(
+            """
+            INSERT OR REPLACE INTO positions
+                (reading_id, latitude, longitude, position_interpolated,
+                 position_source, version)
+            VALUES (?, ?, ?, ?, ?, ?)
+            """,
+            [(point.id, *point.position, version) for point in changed],
+        )
+        for point in changed:
+            point.stored = point.position
+        return len(changed)
+
+
+def setup_positions(conn: sqlite3.Connection) -> None:
+    """Create the derived positions table if it doesn't exist."""
+    conn.execute("""CREATE TABLE IF NOT EXISTS positions
+                (reading_id INTEGER PRIMARY KEY,
+                 latitude REAL,
+                 longitude REAL,
+                 position_interpolated INTEGER NOT NULL,
+                 position_source TEXT NOT NULL,
+                 version INTEGER NOT NULL)""")
+    # Finds what changed since a /readings?since= cursor
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_positions_version ON positions(version)"
+    )
+
+
+_trackers_lock = threading.Lock()
+
+
+def earliest_change(conn: sqlite3.Connection, since: int) -> Optional[int]:
+    """
+    Find where the cruise readings changed since a cursor.
+
+    Args:
+        conn: Connection to read with
+        since: Highest reading id at the time of the cursor
+
+    Returns:
+        Time in epoch milliseconds of the earliest reading that is new or
+        whose position changed since the cursor, or None if nothing did
+    """
+    # Positions are stamped with the cursor of the write that changed them
+    (earliest,) = conn.execute(
+        """
+        SELECT MIN(timestamp_ms)
+        FROM (
+            SELECT r.timestamp_ms
+            FROM positions p
+            JOIN readings r ON r.id = p.reading_id
+            WHERE p.version > ?
+            UNION ALL
+            SELECT timestamp_ms
+            FROM readings
+            WHERE altitude > 10000 AND id > ?
+        )
+        """,
+        (since, since),
+    ).fetchone()
+    return earliest
+
+
+def readings_cursor(conn: sqlite3.Connection) -> int:
+    """
+    Get the cursor for everything committed so far: the highest reading id,
+    or the version positions were stamped with by a backfill after it.
+    """
+    (cursor,) = conn.execute(
+        """
+        SELECT MAX(
+            COALESCE((SELECT MAX(id) FROM readings), 0),
+            COALESCE((SELECT MAX(version) FROM positions), 0)
+        )
+        """
+    ).fetchone()
+    return cursor
+
+
+def position_tracker(database: Database) -> InterpolationState:
+    """
+    Get the interpolation state that keeps a database's positions table up
+    to date, creating it on first use.
+
+    It is rebuilt from the database if a write it was updated in is rolled
+    back, since it may have got ahead of what was committed.
+    """
+    with _trackers_lock:
+        tracker = database.extensions.get("positions")
+        if tracker is None:
+            tracker = database.extensions["positions"] = InterpolationState()
+            database.add_commit_listener(tracker.committed, locked=True)
+            database.add_rollback_listener(tracker.rolled_back)
+        return tracker
+
+
+def backfill_positions(conn: sqlite3.Connection) -> int:
+    """
+    Recompute the position of every cruise reading from scratch.
+
+    Readings are dead-reckoned in timestamp_ms order, so the column is added
+    and filled in first for a database from before it existed.
+
+    The rebuilt positions are stamped with a version past every cursor handed
+    out so far, reserved like the id of a new reading, so clients following
+    /readings?since= see all of them as changed and cached responses go
+    stale.
+
+    Returns:
+        Number of positions written
+    """
+    setup_timestamps(conn)
+    setup_positions(conn)
+    (sequence,) = conn.execute(
+        "SELECT COALESCE(MAX(seq), 0) FROM sqlite_sequence WHERE name = 'readings'"
+    ).fetchone()
+    version = max(readings_cursor(conn), sequence) + 1
+
+    conn.execute("DELETE FROM positions")
+    written = InterpolationState().update(conn)
+    conn.execute("UPDATE positions SET version = ?", (version,))
+    # The next reading recorded comes after the backfill
+    conn.execute(
+        "UPDATE sqlite_sequence SET seq = ? WHERE name = 'readings'", (version,)
+    )
+    return written
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Recompute the derived positions table for every reading"
+    )
+    parser.add_argument(
+        "--db-path", default="flight_data.db", help="Path to the SQLite database"
+    )
+    args = parser.parse_args()
+
+    conn = sqlite3.connect(args.db_path)
+    conn.row_factory = sqlite3.Row
+    written = backfill_positions(conn)
+    conn.commit()
+    conn.close()
+
+    print(f"Wrote {written} positions")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,254 @@
+import argparse
+import sqlite3
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+import httpx
+
+from archive import load_raw_data
+from demo_data import generate_demo_data
+
+
+def load_contents_from_db(db_path: str) -> List[Dict[str, Any]]:
+    """Load every reading in a database as a /record content object."""
+    conn = sqlite3.connect(db_path)
+    conn.row_factory = sqlite3.Row
+    try:
+        rows = conn.execute("SELECT * FROM readings ORDER BY timestamp").fetchall()
+        try:
+            archived = load_raw_data(conn, [row["id"] for row in rows])
+        except sqlite3.OperationalError:
+            # Database from before the raw payload archive
+            archived = {}
+    finally:
+        conn.close()
+
+    contents = []
+    for row in rows:
+        content = dict(row)
+        content_id = content.pop("id")
+        if content["raw_data"] is None:
+            content["raw_data"] = archived.get(content_id, "{}")
+        contents.append(content)
+    return contents
+
+
+def _timestamp_seconds(timestamp: Any) -> Optional[float]:
+    """Get a reading's timestamp in seconds, whether ISO text or epoch millis."""
+    try:
+        return float(timestamp) / 1000.0
+    except (TypeError, ValueError):
+        pass
+    try:
+        return datetime.fromisoformat(timestamp).timestamp()
+    except (TypeError, ValueError):
+        return None
+
+
+def shift_timestamps(contents: List[Dict[str, Any]]) -> None:
+    """Move every reading's timestamp forward so the first one is now, so that
+    replaying into the database they came from doesn't collide with them."""
+    first = _timestamp_seconds(contents[0]["timestamp"]) if contents else None
+    if first is None:
+        return
+    offset = time.time() - first
+    for content in contents:
+        timestamp = content["timestamp"]
+        try:
+            # Epoch millis, whether sent as a number or as a string of digits
+            shifted = int(float(timestamp) + offset * 1000)
+        except (TypeError, ValueError):
+            content["timestamp"] = (
+                datetime.fromisoformat(timestamp) + timedelta(seconds=offset)
+            ).isoformat()
+            continue
+        content["timestamp"] = str(shifted) if isinstance(timestamp, str) else shifted
+
+
+def schedule(
+    contents: List[Dict[str, Any]], rate: float, speedup: float
+) -> List[float]:
+    """
+    Work out when to send each reading, in seconds after the replay starts.
+
+    Readings are sent at a fixed `rate` per second if it is set, otherwise at
+    their original spacing compressed by `speedup`, otherwise all at once.
+    """
+    if rate > 0:
+        return [i / rate for i in range(len(contents))]
+    if speedup > 0 and contents:
+        times = [_timestamp_seconds(content["timestamp"]) for content in contents]
+        if None not in times:
+            return [(t - times[0]) / speedup for t in times]
+    return [0.0] * len(contents)
+
+
+def percentile(sorted_values: List[float], p: float) -> float:
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(int(round(p / 100.0 * len(sorted_values) + 0.5)) - 1, 0)
+    return sorted_values[min(rank, len(sorted_values) - 1)]
+
+
+class Replay:
+    """Fires readings at /record from several concurrent senders."""
+
+    def __init__(
+        self,
+        url: str,
+        contents: List[Dict[str, Any]],
+        send_times: List[float],
+        concurrency: int,
+    ):
+        self.url = url
+        self.contents = contents
+        self.send_times = send_times
+        self.concurrency = concurrency
+
+        self._next = 0
+        self._lock = threading.Lock()
+        self.latencies: List[float] = []
+        self.counts = {
+            "success": 0,
+            "duplicate": 0,
+            "unique_rejected": 0,
+            "http_error": 0,
+            "connection_error": 0,
+        }
+
+    def _take(self) -> Optional[int]:
+        with self._lock:
+            if self._next >= len(self.contents):
+                return None
+            self._next += 1
+            return self._next - 1
+
+    def _record(self, outcome: str, latency: Optional[float]) -> None:
+        with self._lock:
+            self.counts[outcome] += 1
+            if latency is not None:
+                self.latencies.append(latency)
+
+    def _send(self, client: httpx.Client, start: float) -> None:
+        while True:
+            i = self._take()
+            if i is None:
+                return
+
+            delay = start + self.send_times[i] - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+
+            sent = time.perf_counter()
+            try:
+                response = client.post(self.url, json={"content": self.contents[i]})
+            except httpx.HTTPError:
+                self._record("connection_error", None)
+                continue
+            latency = time.perf_counter() - sent
+
+            if response.status_code < 300:
+                body = response.json()
+                duplicate = body.get("status") == "duplicate"
+                self._record("duplicate" if duplicate else "success", latency)
+            elif "UNIQUE constraint" in response.text:
+                self._record("unique_rejected", latency)
+            else:
+                self._record("http_error", latency)
+
+    def run(self) -> float:
+        """Send every reading and get how long it took, in seconds."""
+        start = time.perf_counter()
+        threads = []
+        for _ in range(self.concurrency):
+            client = httpx.Client(timeout=30.0)
+            thread = threading.Thread(target=self._send, args=(client, start))
+            thread.start()
+            threads.append((thread, client))
+        for thread, client in threads:
+            thread.join()
+            client.close()
+        return time.perf_counter() - start
+
+    def report(self, elapsed: float) -> None:
+        """Print throughput, latency percentiles and error counts."""
+        latencies = sorted(self.latencies)
+        sent = sum(self.counts.values())
+        print(f"Sent {sent} readings in {elapsed:.2f}s ({sent / elapsed:.1f}/s)")
+        print(
+            "Latency (ms): "
+            f"p50 {percentile(latencies, 50) * 1000:.2f}, "
+            f"p95 {percentile(latencies, 95) * 1000:.2f}, "
+            f"p99 {percentile(latencies, 99) * 1000:.2f}, "
+            f"max {(latencies[-1] if latencies else 0) * 1000:.2f}"
+        )
+        for outcome, count in self.counts.items():
+            print(f"  {outcome}: {count}")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Replay recorded or demo readings against /record"
+    )
+    parser.add_argument(
+        "--url",
+        default="http://127.0.0.1:1337/record",
+        help="Record endpoint to send readings to "
+        "(default: http://127.0.0.1:1337/record)",
+    )
+    parser.add_argument(
+        "--db-path", help="Replay the readings in this database instead of demo data"
+    )
+    parser.add_argument(
+        "--num-points",
+        type=int,
+        default=1000,
+        help="Number of demo readings to generate (default: 1000)",
+    )
+    parser.add_argument(
+        "--rate",
+        type=float,
+        default=0,
+        help="Readings per second to send (default: as fast as possible)",
+    )
+    parser.add_argument(
+        "--speedup",
+        type=float,
+        default=0,
+        help="Send readings at their original spacing compressed by this factor, "
+        "if --rate isn't given",
+    )
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=4,
+        help="Number of concurrent senders (default: 4)",
+    )
+    parser.add_argument(
+        "--shift-timestamps",
+        action="store_true",
+        help="Move timestamps forward to now, so replayed readings are new",
+    )
+    args = parser.parse_args()
+
+    if args.db_path:
+        contents = load_contents_from_db(args.db_path)
+    else:
+        contents = generate_demo_data("DEMO", "REPLAY", args.num_points)
+    if args.shift_timestamps:
+        shift_timestamps(contents)
+
+    replay = Replay(
+        args.url,
+        contents,
+        schedule(contents, args.rate, args.speedup),
+        args.concurrency,
+    )
+    replay.report(replay.run())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+import sqlite3
+
+from parsers import epoch_ms
+
+# Columns read most often from cruise readings: the map's position and
+# heading, and the time everything is ordered by. Queries that only need
+# these are answered from the index without touching the table.
+CRUISE_INDEX = "idx_readings_cruise_ms"
+CRUISE_INDEX_COLUMNS = (
+    "timestamp_ms",
+    "altitude",
+    "latitude",
+    "longitude",
+    "true_heading",
+)
+CRUISE_INDEX_SQL = (
+    f"CREATE INDEX {CRUISE_INDEX} ON readings({', '.join(CRUISE_INDEX_COLUMNS)}) "
+    "WHERE altitude > 10000"
+)
+
+# Unique index on the time readings are ordered by, so that no two readings
+# share one and the time alone is a stable position to page from
+TIMESTAMP_INDEX = "idx_readings_timestamp_ms"
+
+
+def setup_readings(conn: sqlite3.Connection) -> None:
+    """Create the readings table and its timestamp index if they don't exist."""
+    conn.execute("""CREATE TABLE IF NOT EXISTS readings
+                (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                 timestamp TEXT NOT NULL,
+                 timestamp_ms INTEGER,
+                 latitude REAL,
+                 longitude REAL,
+                 altitude REAL,
+                 estimated_arrival_time TEXT,
+                 ground_speed REAL,
+                 outside_air_temperature REAL,
+                 true_heading REAL,
+                 wind_direction REAL,
+                 wind_speed REAL,
+                 distance_to_destination REAL,
+                 distance_from_origin REAL,
+                 distance_traveled REAL,
+                 weight_on_wheels TEXT,
+                 time_to_destination_minutes INTEGER,
+                 total_flight_time_minutes INTEGER,
+                 scheduled_departure_time TEXT,
+                 decompression TEXT,
+                 all_doors_closed TEXT,
+                 departure_airport TEXT,
+                 destination_airport TEXT,
+                 flight_number TEXT,
+                 aircraft_type TEXT,
+                 raw_data JSON,
+                 UNIQUE(timestamp))""")
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_readings_timestamp ON readings(timestamp)"
+    )
+
+
+def setup_timestamps(conn: sqlite3.Connection) -> int:
+    """
+    Add the timestamp_ms column to the readings table if it doesn't have it,
+    and fill it in for readings recorded before it existed.
+
+    timestamp keeps what the recorder sent, ISO 8601 text or epoch
+    milliseconds, and timestamp_ms is the same time as an integer (see
+    parsers.epoch_ms), which readings are ordered, windowed and
+    dead-reckoned by. The cruise index (see setup_indexes) is what indexes
+    it for those; TIMESTAMP_INDEX keeps it unique, so it also identifies a
+    reading, whichever form its time was sent in.
+
+    Returns:
+        Number of readings filled in
+    """
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(readings)")}
+    if "timestamp_ms" not in columns:
+        conn.execute("ALTER TABLE readings ADD COLUMN timestamp_ms INTEGER")
+    # Replaced by the unique index, which finds the readings still to fill in
+    # just as well
+    conn.execute("DROP INDEX IF EXISTS idx_readings_timestamp_ms_missing")
+
+    index = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = ?",
+        (TIMESTAMP_INDEX,),
+    ).fetchone()
+    if not index:
+        # Readings filled in before the index existed can share a time, such
+        # as the same moment sent once as ISO text and once as epoch
+        # milliseconds. Keep the first and leave the rest out.
+        conn.execute("""UPDATE readings SET timestamp_ms = NULL
+                        WHERE timestamp_ms IS NOT NULL
+                        AND id NOT IN (SELECT MIN(id) FROM readings
+                                       WHERE timestamp_ms IS NOT NULL
+                                       GROUP BY timestamp_ms)""")
+        conn.execute(f"CREATE UNIQUE INDEX {TIMESTAMP_INDEX} ON readings(timestamp_ms)")
+
+    rows = conn.execute(
+        "SELECT id, timestamp FROM readings WHERE timestamp_ms IS NULL ORDER BY id"
+    ).fetchall()
+    updates = []
+    for reading_id, timestamp in rows:
+        try:
+            updates.append((epoch_ms(timestamp), reading_id))
+        except ValueError:
+            # Left out of every query that orders by time
+            continue
+    # A reading at the same time as an earlier one is a duplicate of it, and
+    # is left out too
+    cursor = conn.executemany(
+        "UPDATE OR IGNORE readings SET timestamp_ms = ? WHERE id = ?", updates
+    )
+    return max(cursor.rowcount, 0)
+
+
+def setup_indexes(conn: sqlite3.Connection) -> None:
+    """
+    Create the indexes behind the readings queries, and make sure the query
+    planner has statistics to choose them with.
+
+    Every query for the flight's readings filters on altitude > 10000 and
+    orders by time. A partial index on the time holding only those readings
+    serves both, and skips the readings on the ground, climbing and
+    descending without reading them. Those queries name the index (see
+    app.readings_query), so it is rebuilt here if it's missing or isn't
+    what they expect, as in a database made by hand.
+    """
+    # Replaced by the one on timestamp_ms
+    conn.execute("DROP INDEX IF EXISTS idx_readings_cruise")
+    existing = conn.execute(
+        "SELECT sql FROM sqlite_master WHERE type = 'index' AND name = ?",
+        (CRUISE_INDEX,),
+    ).fetchone()
+    if existing is None or " ".join(existing[0].split()) != CRUISE_INDEX_SQL:
+        conn.execute(f"DROP INDEX IF EXISTS {CRUISE_INDEX}")
+        conn.execute(CRUISE_INDEX_SQL)
+
+    # Statistics for the queries that leave the choice of index to SQLite. A
+    # full ANALYZE the first time the index exists, then only when SQLite
+    # thinks they are out of date.
+    analyzed = (
+        conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'sqlite_stat1'"
+        ).fetchone()
+        and conn.execute(
+            "SELECT 1 FROM sqlite_stat1 WHERE idx = ?", (CRUISE_INDEX,)
+        ).fetchone()
+    )
+    if analyzed:
+        conn.execute("PRAGMA optimize")
+    else:
+        conn.execute("ANALYZE")
@@ -0,0 +1,55 @@
+import json
+from typing import Any, Iterable, Iterator
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Bytes of JSON gathered before a streamed response sends them
+STREAM_CHUNK_SIZE = 64 * 1024
+
+
+def dumps(obj: Any) -> bytes:
+    """
+    Serialize to compact JSON.
+
+    Uses orjson if it's installed, which is several times faster than the
+    standard library.
+    """
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, separators=(",", ":")).encode("utf-8")
+
+
+def json_array_chunks(
+    items: Iterable[Any], chunk_size: int = STREAM_CHUNK_SIZE
+) -> Iterator[bytes]:
+    """
+    Serialize items as a JSON array, a chunk at a time.
+
+    Items are only taken from the iterable as the chunks are consumed, so
+    however many there are, only about one chunk is held in memory.
+
+    Args:
+        items: Items to serialize
+        chunk_size: Approximate size in bytes of each chunk
+
+    Returns:
+        Iterator over the chunks, which together make up the array
+    """
+    buffer = [b"["]
+    size = 1
+    separator = b""
+    for item in items:
+        data = dumps(item)
+        buffer.append(separator)
+        buffer.append(data)
+        separator = b","
+        size += len(data) + 1
+        if size >= chunk_size:
+            yield b"".join(buffer)
+            buffer = []
+            size = 0
+    buffer.append(b"]")
+    yield b"".join(buffer)
@@ -0,0 +1,171 @@
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from positions import LATITUDE_SQL, LONGITUDE_SQL
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# Metrics that can be downsampled, and the SQL that reads each one from
+# readings r LEFT JOIN positions p. Positions come from the positions table
+# when they've been dead-reckoned, like /readings.
+SERIES_METRICS = {
+    "longitude": LONGITUDE_SQL,
+    "latitude": LATITUDE_SQL,
+    "altitude": "r.altitude",
+    "ground_speed": "r.ground_speed",
+    "true_heading": "r.true_heading",
+    "wind_speed": "r.wind_speed",
+    "wind_direction": "r.wind_direction",
+    "outside_air_temperature": "r.outside_air_temperature",
+    "distance_to_destination": "r.distance_to_destination",
+    "distance_from_origin": "r.distance_from_origin",
+    "distance_traveled": "r.distance_traveled",
+    "time_to_destination_minutes": "r.time_to_destination_minutes",
+    "total_flight_time_minutes": "r.total_flight_time_minutes",
+}
+
+# Number of downsampled series kept, across metrics and sizes
+SERIES_CACHE_SIZE = 64
+
+
+def lttb(x: Sequence[float], y: Sequence[float], max_points: int) -> List[int]:
+    """
+    Downsample a series with Largest-Triangle-Three-Buckets.
+
+    The first and last points are always kept. The points between them are
+    split into max_points - 2 buckets, and from each bucket the point that
+    makes the largest triangle with the point kept from the previous bucket
+    and the average of the next bucket is kept, which preserves the peaks
+    and troughs a plot of the full series would show.
+
+    Uses numpy if it's installed.
+
+    Args:
+        x: X values, in increasing order
+        y: Y values
+        max_points: Maximum number of points to keep, at least 3
+
+    Returns:
+        Indexes of the points kept, in increasing order
+    """
+    n = len(x)
+    if max_points >= n or max_points < 3:
+        return list(range(n))
+    if numpy is not None:
+        return _lttb_numpy(x, y, max_points)
+    return _lttb_python(x, y, max_points)
+
+
+def _bucket_bounds(n: int, max_points: int) -> List[int]:
+    # Bucket i covers indexes bounds[i] to bounds[i + 1], excluding the first
+    # and last points; the final entry is the last point on its own
+    every = (n - 2) / (max_points - 2)
+    return [int(i * every) + 1 for i in range(max_points - 1)] + [n]
+
+
+def _lttb_python(x: Sequence[float], y: Sequence[float], max_points: int) -> List[int]:
+    bounds = _bucket_bounds(len(x), max_points)
+    kept = [0]
+    a = 0
+    for i in range(max_points - 2):
+        start, end = bounds[i], bounds[i + 1]
+        next_start, next_end = bounds[i + 1], bounds[i + 2]
+        count = next_end - next_start
+        average_x = sum(x[next_start:next_end]) / count
+        average_y = sum(y[next_start:next_end]) / count
+
+        # Twice the triangle's area, which ranks the same
+        best, best_area = start, -1.0
+        for j in range(start, end):
+            area = abs(
+                (x[a] - average_x) * (y[j] - y[a]) - (x[a] - x[j]) * (average_y - y[a])
+            )
+            if area > best_area:
+                best, best_area = j, area
+        a = best
+        kept.append(a)
+    kept.append(len(x) - 1)
+    return kept
+
+
+def _lttb_numpy(x: Sequence[float], y: Sequence[float], max_points: int) -> List[int]:
+    xs = numpy.asarray(x, dtype=float)
+    ys = numpy.asarray(y, dtype=float)
+    bounds = numpy.array(_bucket_bounds(len(xs), max_points))
+
+    # Every bucket's average at once; each triangle needs the next one's
+    starts = bounds[:-1]
+    counts = numpy.diff(bounds)
+    average_x = numpy.add.reduceat(xs, starts) / counts
+    average_y = numpy.add.reduceat(ys, starts) / counts
+
+    # Only which point was kept from the previous bucket is sequential
+    kept = [0]
+    a = 0
+    for i in range(max_points - 2):
+        start, end = bounds[i], bounds[i + 1]
+        areas = numpy.abs(
+            (xs[a] - average_x[i + 1]) * (ys[start:end] - ys[a])
+            - (xs[a] - xs[start:end]) * (average_y[i + 1] - ys[a])
+        )
+        a = start + int(areas.argmax())
+        kept.append(a)
+    kept.append(len(xs) - 1)
+    return kept
+
+
+class SeriesCache:
+    """
+    Downsampled series, by metric and size, for the latest version of the
+    readings that each was built from.
+    """
+
+    def __init__(self, size: int = SERIES_CACHE_SIZE):
+        self.size = size
+        self._lock = threading.Lock()
+        self._series: "OrderedDict[Tuple[str, int], Tuple[str, Any]]" = OrderedDict()
+
+    def get(self, metric: str, max_points: int, version: str) -> Optional[Any]:
+        """Get a series if it was built from this version of the readings."""
+        with self._lock:
+            cached = self._series.get((metric, max_points))
+            if cached is None or cached[0] != version:
+                return None
+            self._series.move_to_end((metric, max_points))
+            return cached[1]
+
+    def put(self, metric: str, max_points: int, version: str, series: Any) -> None:
+        """Remember a series, replacing any built from another version."""
+        with self._lock:
+            self._series[(metric, max_points)] = (version, series)
+            self._series.move_to_end((metric, max_points))
+            while len(self._series) > self.size:
+                self._series.popitem(last=False)
+
+
+def downsample(
+    rows: Sequence[Tuple[int, Optional[float]]], max_points: int
+) -> Dict[str, Any]:
+    """
+    Downsample a metric's series for plotting.
+
+    Args:
+        rows: Time in epoch milliseconds and value of every reading, in time
+              order; readings without a value are left out
+        max_points: Maximum number of points to return
+
+    Returns:
+        Dictionary with the number of readings that had a value, and the
+        timestamps and values of the points kept
+    """
+    points = [row for row in rows if row[1] is not None]
+    kept = lttb([row[0] for row in points], [row[1] for row in points], max_points)
+    return {
+        "total": len(points),
+        "timestamps": [points[i][0] for i in kept],
+        "values": [points[i][1] for i in kept],
+    }
@@ -0,0 +1,24 @@
+from app import create_app
+from broadcast import commit_broadcaster
+from db import FLIGHT_DB_PATH, close_all, get_database
+from demo_data import write_demo_data_to_db
+
+
+def test_apps_share_one_commit_listener(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    write_demo_data_to_db(FLIGHT_DB_PATH, "TEST", "", 10)
+    try:
+        apps = [create_app(airline="TEST") for _ in range(3)]
+        database = get_database(FLIGHT_DB_PATH)
+
+        broadcaster = commit_broadcaster(database)
+        assert all(app.extensions["broadcaster"] is broadcaster for app in apps)
+        assert database._commit_listeners.count(broadcaster.publish) == 1
+
+        subscription = broadcaster.subscribe()
+        with database.writer():
+            pass
+        assert subscription.get(0) == [None]
+        assert subscription.get(0) is None
+    finally:
+        close_all()
@@ -0,0 +1,29 @@
+import sqlite3
+
+from db import LOOKUP_CHUNK_SIZE, chunked_lookup
+
+
+def test_chunked_lookup_finds_values_across_chunks():
+    conn = sqlite3.connect(":memory:")
+    conn.execute("CREATE TABLE t (id INTEGER PRIMARY KEY)")
+    count = LOOKUP_CHUNK_SIZE * 2 + 1
+    conn.executemany("INSERT INTO t VALUES (?)", [(i,) for i in range(count)])
+
+    # Every other value, plus some that aren't there
+    values = list(range(0, count, 2)) + [count, count + 1]
+    rows = chunked_lookup(conn, "SELECT id FROM t WHERE id IN ({placeholders})", values)
+
+    assert sorted(row[0] for row in rows) == list(range(0, count, 2))
+
+
+def test_chunked_lookup_of_nothing_runs_no_query():
+    conn = sqlite3.connect(":memory:")
+
+    assert (
+        list(
+            chunked_lookup(
+                conn, "SELECT * FROM missing WHERE x IN ({placeholders})", []
+            )
+        )
+        == []
+    )
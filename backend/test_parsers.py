@@ -0,0 +1,56 @@
+import json
+import os
+
+import pytest
+
+from parsers import BA_FIELDS, DEFAULT_FIELDS, Field, compile_fields, get_parser
+
+EXAMPLE_BA = os.path.join(
+    os.path.dirname(__file__), "..", "frontend", "src", "app", "data", "example_ba.json"
+)
+
+
+def test_scale_applies_after_coercion():
+    parse = compile_fields("test", [Field("altitude", "raw.altitude", float, 1000)])
+
+    assert parse({"raw": {"altitude": "36"}}) == {"altitude": 36000.0}
+
+
+def test_scale_leaves_missing_values_to_default():
+    parse = compile_fields(
+        "test", [Field("altitude", "raw.altitude", float, 1000, default=0)]
+    )
+
+    assert parse({"raw": {"altitude": None}}) == {"altitude": 0}
+    assert parse({}) == {"altitude": 0}
+
+
+def test_ba_fields_have_default_fields_defaults():
+    defaults = {field.target: field.default for field in DEFAULT_FIELDS}
+
+    for field in BA_FIELDS:
+        assert field.default == defaults[field.target], field.target
+
+
+def test_ba_parser_reads_example_capture():
+    with open(EXAMPLE_BA) as f:
+        raw = json.load(f)
+
+    row = get_parser("BA")({"timestamp": 1729770000000, "raw": json.dumps(raw)})
+
+    assert row["departure_airport"] == "FCO"
+    assert row["true_heading"] == 250.0
+    assert row["weight_on_wheels"] == "1"
+    # Not in the portal's data, so the same as content without them
+    assert row["decompression"] is False
+    assert row["all_doors_closed"] is True
+    assert json.loads(row["raw_data"]) == raw
+
+
+@pytest.mark.parametrize("airline", ["DEFAULT", "BA"])
+def test_parsers_fill_every_status_field(airline):
+    row = get_parser(airline)({"timestamp": 0})
+
+    assert row["weight_on_wheels"] is False
+    assert row["decompression"] is False
+    assert row["all_doors_closed"] is True
@@ -0,0 +1,280 @@
+import random
+import sqlite3
+
+import pytest
+
+from app import create_app
+from db import FLIGHT_DB_PATH, close_all, get_database
+from demo_data import generate_demo_data, write_demo_data_to_db
+from positions import (
+    MILLISECONDS_PER_HOUR,
+    InterpolationState,
+    backfill_positions,
+    calculate_new_position,
+    dead_reckon_gap,
+    get_airport_coordinates,
+    position_tracker,
+    setup_positions,
+)
+from schema import setup_readings, setup_timestamps
+
+
+def _per_reading(start_lat, start_lon, headings, speeds, elapsed_times):
+    """What InterpolationState did for every reading of a gap."""
+    lat, lon = start_lat, start_lon
+    positions = []
+    for heading, speed, elapsed_time in zip(headings, speeds, elapsed_times):
+        new_lat, new_lon = calculate_new_position(
+            lat, lon, heading, speed, elapsed_time
+        )
+        lat, lon = round(new_lat, 4), round(new_lon, 4)
+        positions.append((lat, lon))
+    return positions
+
+
+@pytest.mark.parametrize(
+    "start_lat, start_lon",
+    [(51.47, -0.4543), (-33.9461, 151.1772), (64.0, 179.9), (89.5, 0.0)],
+    ids=["heathrow", "sydney", "antimeridian", "pole"],
+)
+def test_dead_reckon_gap_matches_calculate_new_position(start_lat, start_lon):
+    rng = random.Random(0)
+    count = 1000
+    headings = [rng.uniform(0, 360) for _ in range(count)]
+    speeds = [rng.uniform(350, 550) for _ in range(count)]
+    elapsed_times = [rng.uniform(5, 60) / 3600 for _ in range(count)]
+
+    expected = _per_reading(start_lat, start_lon, headings, speeds, elapsed_times)
+    reckoned = dead_reckon_gap(start_lat, start_lon, headings, speeds, elapsed_times)
+
+    assert len(reckoned) == len(expected)
+    error = max(
+        max(abs(a[0] - b[0]), abs(a[1] - b[1])) for a, b in zip(expected, reckoned)
+    )
+    assert error <= 1e-6
+
+
+def test_dead_reckon_gap_stops_at_first_unusable_reading():
+    positions = dead_reckon_gap(
+        51.47, -0.4543, [90.0, None, 90.0], [450.0, 450.0, 450.0], [0.01] * 3
+    )
+
+    assert positions == _per_reading(51.47, -0.4543, [90.0], [450.0], [0.01])
+
+
+def _flight(rng, count, fixes):
+    """Cruise readings 20 to 40 seconds apart, some with a GPS fix."""
+    readings = []
+    time = 1_729_000_000_000
+    lat, lon = 37.6, -122.4
+    for _ in range(count):
+        time += rng.randint(20_000, 40_000)
+        fix = rng.random() < fixes
+        readings.append(
+            {
+                "timestamp": str(time),
+                "timestamp_ms": time,
+                "latitude": lat + rng.uniform(-1, 1) if fix else None,
+                "longitude": lon + rng.uniform(-1, 1) if fix else None,
+                "altitude": 35000,
+                # Now and then a reading is missing what dead reckoning needs
+                "ground_speed": rng.uniform(350, 550) if rng.random() > 0.05 else None,
+                "true_heading": rng.uniform(0, 360) if rng.random() > 0.05 else None,
+                "departure_airport": "SFO",
+            }
+        )
+    return readings
+
+
+def _interpolate_from_scratch(readings, departure_airport):
+    """
+    Fill in missing positions by dead reckoning from the first fix, or the
+    departure airport, one reading at a time over the whole flight. This is
+    how positions were computed before they were kept incrementally.
+    """
+    readings = sorted(readings, key=lambda reading: reading["timestamp_ms"])
+
+    # Find the first actual fix to start from
+    start = next(
+        (
+            i
+            for i, reading in enumerate(readings)
+            if reading["latitude"] is not None and reading["longitude"] is not None
+        ),
+        None,
+    )
+    # If there isn't one, start from the departure airport
+    if start is None:
+        airport_coords = get_airport_coordinates(departure_airport)
+        if airport_coords is None:
+            return readings
+        readings[0]["latitude"], readings[0]["longitude"] = airport_coords
+        readings[0]["position_interpolated"] = True
+        readings[0]["position_source"] = "airport_reference"
+        start = 0
+
+    for previous, current in zip(readings[start:], readings[start + 1 :]):
+        if current["latitude"] is not None and current["longitude"] is not None:
+            current["position_interpolated"] = False
+            current["position_source"] = "actual"
+            continue
+        if (
+            current["ground_speed"] is None
+            or current["true_heading"] is None
+            or previous["latitude"] is None
+            or previous["longitude"] is None
+        ):
+            continue
+
+        elapsed_time = (
+            current["timestamp_ms"] - previous["timestamp_ms"]
+        ) / MILLISECONDS_PER_HOUR
+        new_lat, new_lon = calculate_new_position(
+            previous["latitude"],
+            previous["longitude"],
+            current["true_heading"],
+            current["ground_speed"],
+            elapsed_time,
+        )
+        current["latitude"] = round(new_lat, 4)
+        current["longitude"] = round(new_lon, 4)
+        current["position_interpolated"] = True
+        current["position_source"] = "interpolated"
+
+    return readings
+
+
+def _positions(conn):
+    return {
+        row[0]: row[1:]
+        for row in conn.execute(
+            """
+            SELECT reading_id, latitude, longitude, position_interpolated,
+                position_source
+            FROM positions
+            """
+        )
+    }
+
+
+def _assert_same_positions(positions, expected):
+    assert positions.keys() == expected.keys()
+    for reading_id, position in positions.items():
+        lat, lon, interpolated, source = expected[reading_id]
+        assert position[2:] == (interpolated, source), reading_id
+        for value, expected_value in zip(position[:2], (lat, lon)):
+            if expected_value is None:
+                assert value is None, reading_id
+            else:
+                assert abs(value - expected_value) <= 1e-6, reading_id
+
+
+@pytest.mark.parametrize("seed", range(20))
+@pytest.mark.parametrize("fixes", [0.1, 0.0], ids=["fixes", "airport only"])
+def test_interpolation_state_matches_full_recompute(seed, fixes):
+    rng = random.Random(seed)
+    readings = _flight(rng, 80, fixes)
+    # Recorded out of order, the way late and resent readings arrive
+    recorded = readings[:]
+    rng.shuffle(recorded)
+
+    conn = sqlite3.connect(":memory:")
+    conn.row_factory = sqlite3.Row
+    setup_readings(conn)
+    setup_timestamps(conn)
+    setup_positions(conn)
+    state = InterpolationState()
+    i = 0
+    while i < len(recorded):
+        # One write at a time, or a batch of them
+        batch = recorded[i : i + rng.choice([1, 1, 1, 3, 10])]
+        i += len(batch)
+        conn.executemany(
+            f"INSERT INTO readings ({', '.join(batch[0])}) "
+            f"VALUES ({', '.join('?' for _ in batch[0])})",
+            [tuple(reading.values()) for reading in batch],
+        )
+        state.update(conn)
+
+    ids = {
+        row["timestamp_ms"]: row["id"]
+        for row in conn.execute("SELECT id, timestamp_ms FROM readings")
+    }
+    expected = {
+        ids[reading["timestamp_ms"]]: (
+            reading["latitude"],
+            reading["longitude"],
+            reading.get("position_interpolated", False),
+            reading.get("position_source", "actual"),
+        )
+        for reading in _interpolate_from_scratch(
+            [dict(reading) for reading in recorded], "SFO"
+        )
+    }
+    _assert_same_positions(_positions(conn), expected)
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    """The app, serving a demo flight from a temporary directory."""
+    # The app reads flight_data.db from the working directory
+    monkeypatch.chdir(tmp_path)
+    write_demo_data_to_db(FLIGHT_DB_PATH, "TEST", "", 100)
+    yield create_app(airline="TEST").test_client()
+    close_all()
+
+
+def test_rejected_duplicate_keeps_positions(client):
+    tracker = position_tracker(get_database(FLIGHT_DB_PATH))
+    # After the demo flight ends
+    point = dict(generate_demo_data("TEST", "", 2)[1], timestamp="2100-01-01T00:00:00")
+    assert client.post("/record", json={"content": point}).status_code == 200
+    cursor = tracker._cursor
+
+    # Same time, different payload, so it gets as far as the database
+    duplicate = dict(point, altitude=point["altitude"] + 1)
+    response = client.post("/record", json={"content": duplicate})
+
+    assert response.status_code == 400
+    assert "UNIQUE" in response.get_json()["error"]
+    assert tracker._cursor == cursor
+
+
+def test_failed_update_forgets_positions(client):
+    database = get_database(FLIGHT_DB_PATH)
+    tracker = position_tracker(database)
+
+    with pytest.raises(RuntimeError):
+        with database.writer() as conn:
+            conn.execute(
+                "DELETE FROM readings WHERE id = (SELECT MAX(id) FROM readings)"
+            )
+            tracker.update(conn)
+            raise RuntimeError("after the update")
+
+    assert tracker._cursor == 0
+
+
+def test_backfill_invalidates_cursors_and_etags(client):
+    response = client.get("/readings?since=0")
+    cursor, etag = response.get_json()["cursor"], response.headers["ETag"]
+    readings = response.get_json()["readings"]
+
+    with get_database(FLIGHT_DB_PATH).writer() as conn:
+        backfill_positions(conn)
+
+    assert client.get("/readings", headers={"If-None-Match": etag}).status_code == 200
+    delta = client.get(f"/readings?since={cursor}").get_json()
+    assert delta["cursor"] > cursor
+    assert delta["readings"] == readings
+
+    # Readings recorded after the backfill are still picked up from its cursor
+    point = dict(
+        generate_demo_data("TEST", "", 2)[1],
+        timestamp="2100-01-01T00:00:00",
+        altitude=35000,
+    )
+    assert client.post("/record", json={"content": point}).status_code == 200
+    delta = client.get(f"/readings?since={delta['cursor']}").get_json()
+    assert delta["readings"][-1]["altitude"] == 35000
+    assert delta["readings"][-1]["timestamp"] > readings[-1]["timestamp"]
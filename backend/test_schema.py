@@ -0,0 +1,101 @@
+import sqlite3
+
+import pytest
+
+from app import READING_FIELDS, readings_query, window_condition
+from demo_data import write_demo_data_to_db
+from positions import setup_positions
+from schema import CRUISE_INDEX, CRUISE_INDEX_SQL, setup_indexes, setup_timestamps
+
+# What the map reads for every reading
+MAP_FIELDS = ("timestamp", "latitude", "longitude", "true_heading")
+
+
+@pytest.fixture
+def demo_db(tmp_path):
+    """A demo flight's database, set up as the app sets it up."""
+    path = str(tmp_path / "flight_data.db")
+    write_demo_data_to_db(path, "TEST", "", 100)
+    conn = sqlite3.connect(path)
+    setup_timestamps(conn)
+    setup_positions(conn)
+    setup_indexes(conn)
+    conn.commit()
+    yield conn
+    conn.close()
+
+
+def _plan(conn, query, params=()):
+    return [
+        row[3]
+        for row in conn.execute(
+            f"EXPLAIN QUERY PLAN {query} ORDER BY r.timestamp_ms ASC", params
+        )
+    ]
+
+
+def _times(conn, *fractions):
+    """Times the given fractions of the way through the flight, or None."""
+    first, last = conn.execute(
+        "SELECT MIN(timestamp_ms), MAX(timestamp_ms) FROM readings"
+    ).fetchone()
+    return [
+        None if fraction is None else first + int((last - first) * fraction)
+        for fraction in fractions
+    ]
+
+
+@pytest.mark.parametrize(
+    "fields",
+    [READING_FIELDS, MAP_FIELDS],
+    ids=["all", "map"],
+)
+def test_flight_is_read_in_time_order_without_sorting(demo_db, fields):
+    cruise, _ = window_condition()
+    plan = _plan(demo_db, f"{readings_query(fields, False)} WHERE {cruise}")
+
+    assert not any("TEMP B-TREE" in step for step in plan), plan
+
+
+@pytest.mark.parametrize(
+    "start, end",
+    [(0.25, 0.5), (0.0, 1.0), (0.5, None), (None, 0.5)],
+    ids=["window", "whole flight", "from", "to"],
+)
+def test_window_is_a_range_search_without_sorting(demo_db, start, end):
+    where, params = window_condition(*_times(demo_db, start, end))
+    plan = _plan(
+        demo_db, f"{readings_query(READING_FIELDS, False)} WHERE {where}", params
+    )
+
+    assert any(
+        step.startswith("SEARCH r ") and "(timestamp_ms" in step for step in plan
+    ), plan
+    assert not any("TEMP B-TREE" in step for step in plan), plan
+
+
+def test_map_fields_are_covered_by_cruise_index(demo_db):
+    cruise, _ = window_condition()
+    plan = _plan(demo_db, f"{readings_query(MAP_FIELDS, False)} WHERE {cruise}")
+
+    assert any(f"COVERING INDEX {CRUISE_INDEX}" in step for step in plan), plan
+
+
+@pytest.mark.parametrize(
+    "sql",
+    [None, f"CREATE INDEX {CRUISE_INDEX} ON readings(timestamp_ms)"],
+    ids=["missing", "different"],
+)
+def test_setup_indexes_rebuilds_cruise_index(demo_db, sql):
+    demo_db.execute(f"DROP INDEX {CRUISE_INDEX}")
+    if sql is not None:
+        demo_db.execute(sql)
+
+    setup_indexes(demo_db)
+
+    (existing,) = demo_db.execute(
+        "SELECT sql FROM sqlite_master WHERE name = ?", (CRUISE_INDEX,)
+    ).fetchone()
+    assert existing == CRUISE_INDEX_SQL
+    cruise, _ = window_condition()
+    demo_db.execute(f"{readings_query(READING_FIELDS, False)} WHERE {cruise}")
@@ -0,0 +1,48 @@
+import random
+
+import pytest
+
+from series import _lttb_numpy, _lttb_python, downsample, lttb
+
+
+def _series(rng, count):
+    """Times a few seconds apart, and a value that wanders."""
+    x, y = [], []
+    time, value = 0, 0.0
+    for _ in range(count):
+        time += rng.randint(1_000, 60_000)
+        value += rng.gauss(0, 100)
+        x.append(time)
+        y.append(value)
+    return x, y
+
+
+@pytest.mark.parametrize("seed", range(10))
+@pytest.mark.parametrize("count, max_points", [(1000, 100), (101, 3), (500, 499)])
+def test_lttb_numpy_keeps_same_points_as_python(seed, count, max_points):
+    pytest.importorskip("numpy")
+    x, y = _series(random.Random(seed), count)
+
+    assert _lttb_numpy(x, y, max_points) == _lttb_python(x, y, max_points)
+
+
+def test_lttb_keeps_peaks_and_ends():
+    x = list(range(100))
+    y = [0.0] * 100
+    y[37] = 1000.0
+
+    kept = lttb(x, y, 10)
+
+    assert len(kept) == 10
+    assert kept[0] == 0 and kept[-1] == 99
+    assert 37 in kept
+
+
+def test_downsample_leaves_out_missing_values():
+    rows = [(0, 1.0), (1, None), (2, 3.0)]
+
+    assert downsample(rows, 10) == {
+        "total": 2,
+        "timestamps": [0, 2],
+        "values": [1.0, 3.0],
+    }
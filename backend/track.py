@@ -0,0 +1,217 @@
+import bisect
+import math
+import sqlite3
+import threading
+from typing import Any, Dict, List, Tuple
+
+from positions import LATITUDE_SQL, LONGITUDE_SQL, earliest_change, readings_cursor
+
+# Vertices per block of the track. Simplification runs separately on each
+# block, with the vertices between blocks always kept, so a change only
+# recomputes the blocks from where it happened onwards.
+TRACK_BLOCK_SIZE = 256
+
+# How far, in pixels on screen, the simplified track may stray from the
+# full one
+TRACK_TOLERANCE_PIXELS = 0.5
+
+# Web Mercator can't show the poles
+MAX_MERCATOR_LATITUDE = 85.05112878
+
+
+def mercator(longitude: float, latitude: float) -> Tuple[float, float]:
+    """
+    Project a position with Web Mercator, into a square world with sides of
+    length 1, which is how far apart vertices are on screen at any zoom.
+    """
+    latitude = max(-MAX_MERCATOR_LATITUDE, min(MAX_MERCATOR_LATITUDE, latitude))
+    x = longitude / 360.0 + 0.5
+    y = 0.5 - math.log(math.tan(math.pi / 4 + math.radians(latitude) / 2)) / (
+        2 * math.pi
+    )
+    return x, y
+
+
+def tolerance_for_zoom(zoom: float, width: float) -> float:
+    """
+    Get the simplification tolerance for a map zoom level.
+
+    Args:
+        zoom: How far the map is zoomed in, 1 showing the whole world
+        width: Width in pixels of the whole world at zoom 1
+
+    Returns:
+        Tolerance in the units of `mercator`
+    """
+    return TRACK_TOLERANCE_PIXELS / (width * zoom)
+
+
+def _segment_distance(
+    x: float, y: float, ax: float, ay: float, bx: float, by: float
+) -> float:
+    # Distance from (x, y) to the segment from (ax, ay) to (bx, by)
+    dx = bx - ax
+    dy = by - ay
+    length_squared = dx * dx + dy * dy
+    if length_squared == 0:
+        return math.hypot(x - ax, y - ay)
+    t = max(0.0, min(1.0, ((x - ax) * dx + (y - ay) * dy) / length_squared))
+    return math.hypot(x - (ax + t * dx), y - (ay + t * dy))
+
+
+def douglas_peucker_significance(
+    xs: List[float], ys: List[float], start: int, end: int, significance: List[float]
+) -> None:
+    """
+    Work out how significant each vertex strictly between start and end is.
+
+    A vertex's significance is the largest Douglas-Peucker tolerance at which
+    it is still kept: simplifying with any tolerance gives the same vertices
+    as keeping those whose significance is greater than it. Each vertex is
+    no more significant than the one whose split found it, so that holds
+    for vertices found deep in the recursion too.
+
+    Args:
+        xs: X coordinates of the vertices
+        ys: Y coordinates of the vertices
+        start: Index of the first vertex, which is always kept
+        end: Index of the last vertex, which is always kept
+        significance: Updated with the significance of the vertices in
+                      between
+    """
+    stack = [(start, end, math.inf)]
+    while stack:
+        first, last, limit = stack.pop()
+        if last - first < 2:
+            continue
+        furthest, distance = first + 1, -1.0
+        for i in range(first + 1, last):
+            d = _segment_distance(
+                xs[i], ys[i], xs[first], ys[first], xs[last], ys[last]
+            )
+            if d > distance:
+                furthest, distance = i, d
+        distance = min(distance, limit)
+        significance[furthest] = distance
+        stack.append((first, furthest, distance))
+        stack.append((furthest, last, distance))
+
+
+class TrackSimplifier:
+    """
+    The flight track, with every vertex's Douglas-Peucker significance, so it
+    can be simplified at any tolerance by filtering.
+
+    Kept up to date incrementally: readings appended at the end only
+    recompute the last block, and a reading that arrives late or a position
+    that was interpolated again recomputes from its block onwards.
+    """
+
+    def __init__(self, block_size: int = TRACK_BLOCK_SIZE):
+        self.block_size = block_size
+        self._lock = threading.Lock()
+        self._cursor = 0
+        self._timestamps: List[int] = []
+        self._longitudes: List[float] = []
+        self._latitudes: List[float] = []
+        self._xs: List[float] = []
+        self._ys: List[float] = []
+        self._significance: List[float] = []
+
+    def update(self, conn: sqlite3.Connection) -> None:
+        """
+        Bring the track up to date with the database.
+
+        Args:
+            conn: Connection to read with, inside a transaction so everything
+                  comes from one snapshot
+        """
+        with self._lock:
+            cursor = readings_cursor(conn)
+            if cursor < self._cursor:
+                # Readings were deleted, start over
+                self._cursor = 0
+            since = self._cursor
+            self._cursor = cursor
+
+            if since == 0:
+                condition, params = "r.timestamp_ms IS NOT NULL", ()
+                changed = 0
+            else:
+                earliest = earliest_change(conn, since)
+                if earliest is None:
+                    return
+                condition, params = "r.timestamp_ms >= ?", (earliest,)
+                changed = bisect.bisect_left(self._timestamps, earliest)
+
+            rows = conn.execute(
+                f"""
+                SELECT r.timestamp_ms,
+                    {LONGITUDE_SQL} AS longitude,
+                    {LATITUDE_SQL} AS latitude
+                FROM readings r
+                LEFT JOIN positions p ON p.reading_id = r.id
+                WHERE r.altitude > 10000 AND {condition}
+                ORDER BY r.timestamp_ms ASC
+                """,
+                params,
+            ).fetchall()
+
+            # Replace everything from the earliest change onwards
+            for values in (
+                self._timestamps,
+                self._longitudes,
+                self._latitudes,
+                self._xs,
+                self._ys,
+                self._significance,
+            ):
+                del values[changed:]
+            for timestamp, longitude, latitude in rows:
+                if longitude is None or latitude is None:
+                    continue
+                x, y = mercator(longitude, latitude)
+                self._timestamps.append(timestamp)
+                self._longitudes.append(longitude)
+                self._latitudes.append(latitude)
+                self._xs.append(x)
+                self._ys.append(y)
+                self._significance.append(math.inf)
+
+            self._simplify_from(changed)
+
+    def _simplify_from(self, index: int) -> None:
+        # Every block from the one holding index onwards, or the one ending
+        # there if it's between blocks. The vertices between blocks are
+        # always kept.
+        count = len(self._xs)
+        start = max(0, (index - 1) // self.block_size * self.block_size)
+        for i in range(start, count - 1, self.block_size):
+            end = min(i + self.block_size, count - 1)
+            self._significance[i] = math.inf
+            self._significance[end] = math.inf
+            douglas_peucker_significance(self._xs, self._ys, i, end, self._significance)
+
+    def simplify(self, tolerance: float) -> Dict[str, Any]:
+        """
+        Get the track simplified with a tolerance.
+
+        Args:
+            tolerance: Tolerance in the units of `mercator`
+
+        Returns:
+            Dictionary with the number of vertices in the full track, and the
+            timestamps, longitudes and latitudes of the vertices kept
+        """
+        with self._lock:
+            kept = [
+                i
+                for i, significance in enumerate(self._significance)
+                if significance > tolerance
+            ]
+            return {
+                "total": len(self._significance),
+                "timestamps": [self._timestamps[i] for i in kept],
+                "longitudes": [self._longitudes[i] for i in kept],
+                "latitudes": [self._latitudes[i] for i in kept],
+            }
@@ -8,7 +8,10 @@ const TARGETS = [
 // API endpoint configuration
 const API_CONFIG = {
     baseUrl: 'http://127.0.0.1:1337',
-    recordEndpoint: '/record'
+    recordEndpoint: '/record',
+    // Gzip request bodies before sending them (the backend accepts
+    // Content-Encoding: gzip, deflate, and zstd if installed)
+    compressRequests: false
 };
 
 // Generate URL patterns for each target
@@ -27,15 +30,29 @@ function formatDataForApi(capturedData) {
     };
 }
 
+// Encode a request body, gzipping it if compression is enabled and supported
+async function encodeBody(body) {
+    if (!API_CONFIG.compressRequests || typeof CompressionStream === 'undefined') {
+        return { body, headers: {} };
+    }
+    const stream = new Blob([body]).stream().pipeThrough(new CompressionStream('gzip'));
+    return {
+        body: await new Response(stream).blob(),
+        headers: { 'Content-Encoding': 'gzip' }
+    };
+}
+
 // Send data to the API
 async function sendToApi(data) {
     try {
+        const encoded = await encodeBody(JSON.stringify({ "content": data }));
         const response = await fetch(`${API_CONFIG.baseUrl}${API_CONFIG.recordEndpoint}`, {
             method: 'POST',
             headers: {
                 'Content-Type': 'application/json',
+                ...encoded.headers,
             },
-            body: JSON.stringify({ "content": data })
+            body: encoded.body
         });
 
         if (!response.ok) {
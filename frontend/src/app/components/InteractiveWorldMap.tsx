@@ -5,8 +5,9 @@ import { geoMercator, geoPath } from 'd3-geo';
 import { select } from 'd3-selection';
 import { zoom } from 'd3-zoom';
 import { Expand, Minimize } from 'lucide-react';
-import { useEffect, useLayoutEffect, useRef, useState } from 'react';
+import { useEffect, useLayoutEffect, useMemo, useRef, useState } from 'react';
 import { Line, LineChart, Tooltip, XAxis, YAxis } from 'recharts';
+import { getChannel } from '@/app/lib/channel';
 import FlightScrubber from './FlightScrubber';
 
 interface Reading {
@@ -39,12 +40,73 @@ interface Reading {
     flight_phase: string;
 }
 
+interface ReadingsDelta {
+    cursor: number;
+    reset: boolean;
+    readings: Reading[];
+}
+
+// /readings?format=columnar: one array per field, with fields that are the same
+// in every reading (airline, airports, ...) sent once in constants
+interface ColumnarReadings {
+    count: number;
+    constants: Record<string, any>;
+    columns: Record<string, any[]>;
+}
+
+const fromColumnar = (data: ColumnarReadings): Reading[] => {
+    const fields = Object.keys(data.columns);
+    const readings: Reading[] = new Array(data.count);
+    for (let i = 0; i < data.count; i++) {
+        const reading: Record<string, any> = { ...data.constants };
+        for (const field of fields) {
+            reading[field] = data.columns[field][i];
+        }
+        readings[i] = reading as Reading;
+    }
+    return readings;
+};
+
+// The server sends every reading from the earliest changed timestamp onwards,
+// sorted, so the local readings from that point on are replaced wholesale
+const mergeReadings = (existing: Reading[], delta: Reading[]): Reading[] => {
+    if (delta.length === 0) {
+        return existing;
+    }
+
+    // Binary search for the first local reading at or after the delta
+    const start = delta[0].timestamp;
+    let low = 0;
+    let high = existing.length;
+    while (low < high) {
+        const mid = (low + high) >> 1;
+        if (existing[mid].timestamp < start) {
+            low = mid + 1;
+        } else {
+            high = mid;
+        }
+    }
+    return existing.slice(0, low).concat(delta);
+};
+
+// /readings/track: the flight track simplified for a zoom level
+interface TrackData {
+    total: number;
+    timestamps: number[];  // Epoch milliseconds, like Reading.timestamp
+    longitudes: number[];
+    latitudes: number[];
+}
+
 interface WorldData {
     features: any[];
 }
 
 interface InteractiveWorldMapProps {
     worldData: WorldData;
+    // 'stream' has the server push readings as they are recorded,
+    // 'socket' does the same over the WebSocket channel shared with queries,
+    // 'poll' asks for new readings once a second
+    updateMode?: 'stream' | 'socket' | 'poll';
 }
 
 interface MetricConfig {
@@ -56,7 +118,8 @@ interface MetricConfig {
 }
 
 interface TimeSeriesGraphProps {
-    data: any[];
+    // Changes whenever readings do, so the chart fetches its series again
+    version: number;
     config: MetricConfig;
     width: number;
     height: number;
@@ -317,7 +380,30 @@ const getPhaseDescription = (phase: string) => {
     return phases[phase] || phase;
 };
 
-const TimeSeriesGraph = ({ data, config, width, height }: TimeSeriesGraphProps) => {
+const TimeSeriesGraph = ({ version, config, width, height }: TimeSeriesGraphProps) => {
+    const [data, setData] = useState<{ time: string; val: number }[]>([]);
+
+    // The server downsamples the metric to about one point per pixel, so the
+    // chart costs the same however long the flight is
+    useEffect(() => {
+        const controller = new AbortController();
+        fetch(
+            `http://localhost:1337/readings/series?metric=${config.id}&max_points=${Math.round(width)}`,
+            { signal: controller.signal }
+        )
+            .then(response => response.json())
+            .then(series => setData(series.timestamps.map((timestamp: number, i: number) => ({
+                time: new Date(timestamp).toLocaleTimeString(),
+                val: series.values[i],
+            }))))
+            .catch(error => {
+                if (!controller.signal.aborted) {
+                    console.error(`Error fetching ${config.id} series:`, error);
+                }
+            });
+        return () => controller.abort();
+    }, [config.id, width, version]);
+
     return (
         <div>
             <div className="font-mono mb-2 text-sm font-semibold">
@@ -401,17 +487,6 @@ const TimeSeriesGraph = ({ data, config, width, height }: TimeSeriesGraphProps)
 };
 
 
-const prepareGraphData = (readings: Reading[], metricConfig: MetricConfig) => {
-    const rs = readings.map(reading => ({
-        time: new Date(reading.timestamp).toLocaleTimeString(),
-        val: reading[metricConfig.id as keyof Reading],
-    }))
-    console.log(rs);
-    return rs;
-};
-
-
-
 const PlaneIcon = ({ x, y, heading, scale }: { x: number, y: number, heading: number, scale: number }) => {
     return (
         <g transform={`translate(${x},${y}) scale(${1 / scale}) rotate(${heading})`}>
@@ -428,7 +503,7 @@ const PlaneIcon = ({ x, y, heading, scale }: { x: number, y: number, heading: nu
 };
 
 
-const InteractiveWorldMap = ({ worldData }: InteractiveWorldMapProps) => {
+const InteractiveWorldMap = ({ worldData, updateMode = 'stream' }: InteractiveWorldMapProps) => {
     const svgRef = useRef<SVGSVGElement>(null);
     const [dimensions, setDimensions] = useState({
         width: 1200,
@@ -474,32 +549,60 @@ const InteractiveWorldMap = ({ worldData }: InteractiveWorldMapProps) => {
         }
     }, [dimensions]);
 
-    // Modified fetching logic to get all readings at once
-    const fetchReadings = async () => {
-        try {
-            const response = await fetch('http://localhost:1337/readings');
-            const data = await response.json();
-            console.log(data);
+    // Cursor from the last /readings response, so each poll only gets what changed
+    const cursorRef = useRef(0);
+    // Bumped whenever readings change, for the charts
+    const [readingsVersion, setReadingsVersion] = useState(0);
+
+    const applyDelta = (data: ReadingsDelta) => {
+        cursorRef.current = data.cursor;
 
-            // Sort readings by timestamp to ensure correct ordering
-            const sortedReadings = data.sort((a: Reading, b: Reading) => a.timestamp - b.timestamp);
+        if (data.readings.length === 0 && !data.reset) {
+            return;
+        }
+        setReadingsVersion(version => version + 1);
 
-            setReadings(sortedReadings);
+        setReadings(previous => {
+            const merged = mergeReadings(data.reset ? [] : previous, data.readings);
 
             // Set current reading to the most recent one
-            if (sortedReadings.length > 0) {
-                setCurrentReading(sortedReadings[sortedReadings.length - 1]);
+            if (merged.length > 0) {
+                setCurrentReading(merged[merged.length - 1]);
             }
+            return merged;
+        });
+    };
+
+    const fetchReadings = async () => {
+        try {
+            // Columnar is much smaller and quicker to parse than a list of objects
+            const response = await fetch(`http://localhost:1337/readings?since=${cursorRef.current}&format=columnar`);
+            const data = await response.json();
+            applyDelta({ ...data, readings: fromColumnar(data.readings) });
         } catch (error) {
             console.error('Error fetching readings:', error);
         }
     };
 
     useEffect(() => {
+        if (updateMode === 'socket') {
+            return getChannel().subscribeReadings(cursorRef.current, applyDelta);
+        }
+
+        if (updateMode === 'stream' && typeof EventSource !== 'undefined') {
+            // The browser reconnects on its own, resuming from the last event id
+            const source = new EventSource(`http://localhost:1337/readings/stream?since=${cursorRef.current}`);
+            source.addEventListener('readings', (event) => {
+                applyDelta(JSON.parse((event as MessageEvent).data));
+            });
+            source.onerror = () => console.error('Readings stream interrupted, reconnecting');
+            return () => source.close();
+        }
+
         fetchReadings();
         const interval = setInterval(fetchReadings, 1000);
         return () => clearInterval(interval);
-    }, []);
+    }, [updateMode]);
 
     useEffect(() => {
         const handleResize = () => {
@@ -542,18 +645,43 @@ const InteractiveWorldMap = ({ worldData }: InteractiveWorldMapProps) => {
         );
     };
 
-    const renderReadingHistory = () => {
-        if (readings.length < 2) return null;
+    // The track is simplified on the server for the zoom level, rounded up to
+    // a power of two so zooming only refetches it a few times
+    const trackZoom = Math.pow(2, Math.ceil(Math.log2(Math.max(transform.k, 1))));
+    const [track, setTrack] = useState<TrackData | null>(null);
 
-        const pathData = readings
-            .map(pos => {
-                const coords = projection([pos.longitude, pos.latitude]);
+    useEffect(() => {
+        const controller = new AbortController();
+        fetch(
+            `http://localhost:1337/readings/track?zoom=${trackZoom}&width=${dimensions.width}`,
+            { signal: controller.signal }
+        )
+            .then(response => response.json())
+            .then(setTrack)
+            .catch(error => {
+                if (!controller.signal.aborted) {
+                    console.error('Error fetching track:', error);
+                }
+            });
+        return () => controller.abort();
+    }, [trackZoom, dimensions.width, readingsVersion]);
+
+    // Only rebuilt when the track or the projection changes, not on every
+    // zoom or pan event
+    const pathData = useMemo(() => {
+        if (!track || track.longitudes.length < 2) return null;
+
+        return track.longitudes
+            .map((longitude, i) => {
+                const coords = projection([longitude, track.latitudes[i]]);
                 if (!coords || !coords[0] || !coords[1]) return null;
                 return `${coords[0]},${coords[1]}`;
             })
             .filter(coords => coords !== null)
             .join(' L ');
+    }, [track, dimensions]);
 
+    const renderReadingHistory = () => {
         if (!pathData) return null;
 
         return (
@@ -635,7 +763,7 @@ const InteractiveWorldMap = ({ worldData }: InteractiveWorldMapProps) => {
                                 {METRICS_CONFIG.map(metricConfig => (
                                     <TimeSeriesGraph
                                         key={metricConfig.id}
-                                        data={prepareGraphData(readings, metricConfig)}
+                                        version={readingsVersion}
                                         config={metricConfig}
                                         width={chartSize.width}
                                         height={chartSize.height}
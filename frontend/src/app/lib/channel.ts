@@ -0,0 +1,239 @@
+// Client for the backend's /ws channel, which carries live readings and
+// ad-hoc queries over one WebSocket instead of separate HTTP requests.
+// See backend/channel.py for the message format.
+
+const API_URL = 'http://localhost:1337';
+const CHANNEL_URL = 'ws://localhost:1337/ws';
+
+// Delay before reconnecting after the connection drops
+const RECONNECT_DELAY_MS = 2000;
+// Delay before trying the channel again after it couldn't connect at all,
+// e.g. because the server was installed without flask-sock
+const RETRY_DELAY_MS = 30000;
+// Interval between polls of /readings while the channel can't connect
+const POLL_INTERVAL_MS = 1000;
+
+export interface ReadingsDelta {
+    cursor: number;
+    reset: boolean;
+    readings: any[];
+}
+
+interface PendingQuery {
+    resolve: (rows: any[]) => void;
+    reject: (error: Error) => void;
+}
+
+interface ReadingsSubscription {
+    cursor: number;
+    onDelta: (delta: ReadingsDelta) => void;
+}
+
+export class QueryCancelledError extends Error {
+    constructor() {
+        super('Query cancelled');
+    }
+}
+
+class FlightChannel {
+    private socket: WebSocket | null = null;
+    private nextId = 0;
+    private queries = new Map<string, PendingQuery>();
+    private subscriptions = new Map<string, ReadingsSubscription>();
+    private reconnectTimer: ReturnType<typeof setTimeout> | null = null;
+    private pollTimer: ReturnType<typeof setInterval> | null = null;
+    private polling = false;
+
+    private connect() {
+        if (this.socket || typeof WebSocket === 'undefined') {
+            return;
+        }
+
+        const socket = new WebSocket(CHANNEL_URL);
+        this.socket = socket;
+        let opened = false;
+
+        socket.onopen = () => {
+            opened = true;
+            this.stopPolling();
+
+            // Resume every subscription from where it got to
+            this.subscriptions.forEach((subscription, id) => {
+                this.send({ id, type: 'subscribe', since: subscription.cursor });
+            });
+        };
+
+        socket.onmessage = (event) => this.handle(JSON.parse(event.data));
+
+        socket.onclose = () => {
+            this.socket = null;
+
+            // Queries in flight are lost with the connection
+            this.queries.forEach(query => query.reject(new Error('Connection to server lost')));
+            this.queries.clear();
+
+            if (this.subscriptions.size === 0) {
+                return;
+            }
+            if (!opened) {
+                // The channel isn't there, so get readings over HTTP instead
+                // and only try it again now and then
+                this.startPolling();
+            }
+            if (!this.reconnectTimer) {
+                this.reconnectTimer = setTimeout(() => {
+                    this.reconnectTimer = null;
+                    this.connect();
+                }, opened ? RECONNECT_DELAY_MS : RETRY_DELAY_MS);
+            }
+        };
+    }
+
+    private startPolling() {
+        if (this.pollTimer) {
+            return;
+        }
+        this.poll();
+        this.pollTimer = setInterval(() => this.poll(), POLL_INTERVAL_MS);
+    }
+
+    private stopPolling() {
+        if (this.pollTimer) {
+            clearInterval(this.pollTimer);
+            this.pollTimer = null;
+        }
+    }
+
+    /**
+     * Get what changed for every subscription from /readings?since=, which
+     * returns the same deltas as the channel.
+     */
+    private async poll() {
+        if (this.polling) {
+            return;
+        }
+        this.polling = true;
+        try {
+            for (const subscription of Array.from(this.subscriptions.values())) {
+                const response = await fetch(`${API_URL}/readings?since=${subscription.cursor}`);
+                const delta: ReadingsDelta = await response.json();
+                if (!response.ok) {
+                    throw new Error((delta as any).error || 'Failed to fetch readings');
+                }
+                // Skip subscriptions that ended while the request was in flight
+                if (this.pollTimer && Array.from(this.subscriptions.values()).includes(subscription)) {
+                    subscription.cursor = delta.cursor;
+                    subscription.onDelta(delta);
+                }
+            }
+        } catch (error) {
+            console.error('Error fetching readings:', error);
+        } finally {
+            this.polling = false;
+        }
+    }
+
+    private isOpen() {
+        return this.socket !== null && this.socket.readyState === WebSocket.OPEN;
+    }
+
+    private send(message: object) {
+        if (this.isOpen()) {
+            this.socket!.send(JSON.stringify(message));
+        }
+    }
+
+    private handle(message: any) {
+        const query = this.queries.get(message.id);
+        if (query) {
+            this.queries.delete(message.id);
+            if (message.type === 'result') {
+                query.resolve(message.rows);
+            } else if (message.type === 'cancelled') {
+                query.reject(new QueryCancelledError());
+            } else {
+                query.reject(new Error(message.error || 'Failed to execute query'));
+            }
+            return;
+        }
+
+        const subscription = this.subscriptions.get(message.id);
+        if (subscription && message.type === 'readings') {
+            subscription.cursor = message.cursor;
+            subscription.onDelta(message);
+        }
+    }
+
+    /**
+     * Subscribe to readings deltas, starting from a cursor. Polls /readings
+     * for them instead while the channel can't connect.
+     *
+     * Returns a function that ends the subscription.
+     */
+    subscribeReadings(since: number, onDelta: (delta: ReadingsDelta) => void): () => void {
+        const id = `readings-${this.nextId++}`;
+        this.subscriptions.set(id, { cursor: since, onDelta });
+
+        if (this.isOpen()) {
+            this.send({ id, type: 'subscribe', since });
+        } else {
+            // Subscribes once the connection opens
+            this.connect();
+        }
+
+        return () => {
+            this.subscriptions.delete(id);
+            this.send({ id, type: 'cancel' });
+            if (this.subscriptions.size === 0) {
+                this.stopPolling();
+            }
+        };
+    }
+
+    /**
+     * Run a query over the channel, or over HTTP if the channel isn't open.
+     *
+     * Returns the rows, and a function that cancels the query on the server.
+     */
+    query(sql: string): { rows: Promise<any[]>; cancel: () => void } {
+        if (!this.isOpen()) {
+            this.connect();
+
+            const controller = new AbortController();
+            const rows = fetch(`${API_URL}/query`, {
+                method: 'POST',
+                headers: {
+                    'Content-Type': 'application/json',
+                },
+                body: JSON.stringify({ query: sql }),
+                signal: controller.signal,
+            }).then(async response => {
+                const data = await response.json();
+                if (!response.ok) {
+                    throw new Error(data.error || 'Failed to execute query');
+                }
+                return data;
+            }, error => {
+                throw controller.signal.aborted ? new QueryCancelledError() : error;
+            });
+            return { rows, cancel: () => controller.abort() };
+        }
+
+        const id = `query-${this.nextId++}`;
+        const rows = new Promise<any[]>((resolve, reject) => {
+            this.queries.set(id, { resolve, reject });
+        });
+        this.send({ id, type: 'query', query: sql });
+        return { rows, cancel: () => this.send({ id, type: 'cancel' }) };
+    }
+}
+
+// One connection shared by every page and component
+let channel: FlightChannel | null = null;
+
+export const getChannel = (): FlightChannel => {
+    if (!channel) {
+        channel = new FlightChannel();
+    }
+    return channel;
+};
@@ -2,7 +2,8 @@
 
 import { ChevronDown, ChevronRight, Database } from 'lucide-react';
 import Link from 'next/link';
-import React, { useEffect, useState } from 'react';
+import React, { useEffect, useRef, useState } from 'react';
+import { QueryCancelledError, getChannel } from '@/app/lib/channel';
 
 interface ColumnInfo {
     name: string;
@@ -23,6 +24,7 @@ const QueryPage = () => {
     const [schema, setSchema] = useState<SchemaInfo | null>(null);
     const [expandedTables, setExpandedTables] = useState<Set<string>>(new Set());
     const [schemaExpanded, setSchemaExpanded] = useState(false);
+    const cancelQueryRef = useRef<(() => void) | null>(null);
 
     useEffect(() => {
         fetchSchema();
@@ -45,29 +47,26 @@ const QueryPage = () => {
         setError(null);
         setResults(null);
 
-        try {
-            const response = await fetch('http://localhost:1337/query', {
-                method: 'POST',
-                headers: {
-                    'Content-Type': 'application/json',
-                },
-                body: JSON.stringify({ query }),
-            });
-
-            const data = await response.json();
-
-            if (!response.ok) {
-                throw new Error(data.error || 'Failed to execute query');
-            }
+        // Runs over the shared WebSocket channel once it's connected
+        const { rows, cancel } = getChannel().query(query);
+        cancelQueryRef.current = cancel;
 
-            setResults(data);
+        try {
+            setResults(await rows);
         } catch (err) {
-            setError(err instanceof Error ? err.message : 'An error occurred');
+            if (!(err instanceof QueryCancelledError)) {
+                setError(err instanceof Error ? err.message : 'An error occurred');
+            }
         } finally {
+            cancelQueryRef.current = null;
             setLoading(false);
         }
     };
 
+    const handleCancel = () => {
+        cancelQueryRef.current?.();
+    };
+
     const handleKeyDown = (e: React.KeyboardEvent) => {
         if (e.key === 'Enter' && (e.metaKey || e.ctrlKey) && !loading && query.trim()) {
             e.preventDefault();
@@ -208,6 +207,15 @@ const QueryPage = () => {
                                 'Execute'
                             )}
                         </button>
+                        {loading && (
+                            <button
+                                type="button"
+                                onClick={handleCancel}
+                                className="w-full mt-2 py-2 px-4 rounded font-medium text-gray-800 bg-white/90 border hover:bg-gray-50 transition-colors"
+                            >
+                                Cancel
+                            </button>
+                        )}
                     </form>
 
                     {error && (